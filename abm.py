@@ -0,0 +1,128 @@
+import unicodedata
+from typing import Iterable, Optional
+
+import pandas as pd
+
+import db
+
+# Upload row classifications
+NEW = "new"
+EXACT_DUPLICATE = "exact duplicate"
+LIKELY_DUPLICATE = "likely duplicate"
+
+# Legal-form suffixes dropped from the end of a normalised company name
+LEGAL_SUFFIXES = [
+    "inc", "incorporated", "llc", "llp", "lp", "ltd", "limited", "corp", "corporation",
+    "co", "company", "plc", "gmbh", "ag", "sa", "sas", "srl", "spa", "bv", "nv",
+    "pty", "pte", "oy", "ab", "as", "kk", "group", "holdings",
+]
+_SUFFIX_PATTERN = r"(?:\s(?:%s))+$" % "|".join(LEGAL_SUFFIXES)
+
+
+# Drop accents and other combining marks, keeping the letters of any script
+def _strip_marks(name: str) -> str:
+    return "".join(char for char in unicodedata.normalize("NFKD", name) if unicodedata.category(char) != "Mn")
+
+
+# Case-fold, strip punctuation and legal suffixes over a whole column at once.
+# A name with no letters or digits normalises to "", which matches nothing.
+def normalize_company_names(names: pd.Series) -> pd.Series:
+    # Object dtype keeps Python's Unicode-aware \w; Arrow-backed strings match ASCII only
+    s = names.astype(str).map(_strip_marks).astype(object)
+    s = s.str.casefold()
+    s = s.str.replace("&", " and ", regex=False)
+    # "A.C.M.E." and "O'Brien" collapse rather than split into letters
+    s = s.str.replace(r"[.'`]", "", regex=True)
+    s = s.str.replace(r"[^\w\s]|_", " ", regex=True)
+    s = s.str.replace(r"\s+", " ", regex=True).str.strip()
+    s = s.str.replace(r"^the\s", "", regex=True)
+    stripped = s.str.replace(_SUFFIX_PATTERN, "", regex=True).str.strip()
+    # A name that is only a suffix ("Company") keeps its words
+    return stripped.where(stripped != "", s)
+
+
+# Uploaded names as a clean, de-duplicated list of strings
+def clean_company_names(names: Iterable) -> pd.Series:
+    s = pd.Series(list(names), dtype=object)
+    s = s.dropna().astype(str).str.strip()
+    return s[s != ""].drop_duplicates().reset_index(drop=True)
+
+
+# Cleaned names with their normalised keys. This is the expensive, database-free
+# part of an upload, so the batch loader runs it in worker processes.
+def prepare_companies(names: Iterable) -> pd.DataFrame:
+    companies = clean_company_names(names)
+    return pd.DataFrame({"company": companies, "normalized": normalize_company_names(companies)})
+
+
+# Company names from one column of a CSV (the first column if none is given)
+def read_company_csv(source, column: Optional[str] = None) -> pd.Series:
+    df = pd.read_csv(source, usecols=[column] if column else [0], dtype=str)
+    return df.iloc[:, 0]
+
+
+# Classify each uploaded name against the client's existing names using hashed lookups
+def classify_companies(uploaded: Iterable, existing: Iterable) -> pd.DataFrame:
+    return classify_prepared(prepare_companies(uploaded), existing)
+
+
+def classify_prepared(prepared: pd.DataFrame, existing: Iterable) -> pd.DataFrame:
+    companies = prepared["company"]
+    normalized = prepared["normalized"]
+    existing = clean_company_names(existing)
+
+    existing_by_key = pd.Series(existing.values, index=normalize_company_names(existing).values)
+    existing_by_key = existing_by_key[~existing_by_key.index.duplicated() & (existing_by_key.index != "")]
+
+    exact = pd.Series(pd.Index(existing).get_indexer(companies) >= 0)
+    matches_existing = pd.Series(existing_by_key.index.get_indexer(normalized) >= 0)
+    # Later rows that normalise to an earlier row of the same upload
+    repeated = normalized.duplicated() & (normalized != "")
+
+    first_in_upload = pd.Series(companies.values, index=normalized.values)
+    first_in_upload = first_in_upload[~first_in_upload.index.duplicated()]
+    in_upload_only = repeated & ~matches_existing & ~exact
+
+    status = pd.Series(NEW, index=companies.index, dtype=object)
+    status[matches_existing | repeated] = LIKELY_DUPLICATE
+    status[exact] = EXACT_DUPLICATE
+    matches = normalized.map(existing_by_key).astype(object)
+    matches = matches.where(~exact, companies)
+    matches = matches.where(~in_upload_only, normalized.map(first_in_upload))
+
+    return pd.DataFrame({
+        "company": companies,
+        "normalized": normalized,
+        "status": status,
+        "matches": matches,
+    })
+
+
+# Existing names that match any of the given names once normalised
+def match_companies(names: Iterable, existing: Iterable) -> list:
+    wanted = normalize_company_names(clean_company_names(names)).drop_duplicates()
+    # An empty key (a name that is only punctuation) would match every other one
+    wanted = pd.Index(wanted[wanted != ""])
+    existing = clean_company_names(existing)
+    return existing[wanted.get_indexer(normalize_company_names(existing)) >= 0].tolist()
+
+
+# Classify an upload against what the client already tracks
+def plan_upload(client: str, companies: Iterable) -> pd.DataFrame:
+    return classify_companies(companies, db.load_client_companies(client))
+
+
+# pending holds names not yet written, such as an earlier file's in a dry run
+def plan_prepared_upload(client: str, prepared: pd.DataFrame, pending: Iterable = ()) -> pd.DataFrame:
+    return classify_prepared(prepared, [*db.load_client_companies(client), *pending])
+
+
+# Names from a plan that should be written
+def companies_to_insert(plan: pd.DataFrame, include_likely: bool = False) -> list:
+    statuses = [NEW, LIKELY_DUPLICATE] if include_likely else [NEW]
+    return plan.loc[plan["status"].isin(statuses), "company"].tolist()
+
+
+# Write a plan's companies for the client in one statement; returns rows added
+def upload_companies(client: str, plan: pd.DataFrame, include_likely: bool = False) -> int:
+    return db.insert_companies(client, companies_to_insert(plan, include_likely))
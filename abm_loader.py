@@ -0,0 +1,140 @@
+import os
+import sys
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple, Optional
+
+import pandas as pd
+from dotenv import load_dotenv
+
+import abm
+
+# Load ABM target lists for many clients without the browser. CSVs are read
+# and normalised in worker processes; each client is then classified against
+# its current list and written in one statement, as in the Bulk Upload tab.
+#
+#   python abm_loader.py lists/                 # lists/<client>.csv
+#   python abm_loader.py --manifest q3.csv      # columns: client, path[, column]
+#
+# Manifest paths are relative to the manifest. Files are loaded in the order
+# given, so a client listed twice is checked against its first file too; a
+# dry run carries the names it would have added forward to later files.
+
+
+class LoadEntry(NamedTuple):
+    client: str
+    path: str
+    column: Optional[str] = None
+
+
+def entries_from_directory(directory: str, column: Optional[str] = None) -> List[LoadEntry]:
+    return [
+        LoadEntry(os.path.splitext(name)[0], os.path.join(directory, name), column)
+        for name in sorted(os.listdir(directory))
+        if name.lower().endswith(".csv")
+    ]
+
+
+def entries_from_manifest(manifest: str, column: Optional[str] = None) -> List[LoadEntry]:
+    df = pd.read_csv(manifest, dtype=str).fillna("")
+    missing = {"client", "path"} - set(df.columns)
+    if missing:
+        raise ValueError(f"Manifest is missing columns: {', '.join(sorted(missing))}")
+    base = os.path.dirname(os.path.abspath(manifest))
+    return [
+        LoadEntry(
+            row["client"].strip(),
+            os.path.join(base, row["path"].strip()),
+            row.get("column", "").strip() or column,
+        )
+        for _, row in df.iterrows()
+    ]
+
+
+# Runs in a worker process: read one file and normalise its names
+def parse_entry(entry: LoadEntry) -> pd.DataFrame:
+    return abm.prepare_companies(abm.read_company_csv(entry.path, entry.column))
+
+
+# planned maps each client to the names a dry run would have written so far
+def load_entry(entry: LoadEntry, prepared: pd.DataFrame, include_likely: bool, dry_run: bool,
+               planned: dict) -> dict:
+    plan = abm.plan_prepared_upload(entry.client, prepared, planned.get(entry.client, ()))
+    counts = plan["status"].value_counts()
+    if dry_run:
+        to_insert = abm.companies_to_insert(plan, include_likely)
+        planned.setdefault(entry.client, []).extend(to_insert)
+        inserted = len(to_insert)
+    else:
+        inserted = abm.upload_companies(entry.client, plan, include_likely)
+    return {
+        "new": counts.get(abm.NEW, 0),
+        "exact_duplicates": counts.get(abm.EXACT_DUPLICATE, 0),
+        "likely_duplicates": counts.get(abm.LIKELY_DUPLICATE, 0),
+        "inserted": inserted,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load ABM company lists for many clients")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("directory", nargs="?", help="directory of <client>.csv files")
+    source.add_argument("--manifest", help="CSV with client, path and optional column")
+    parser.add_argument("--column", help="company name column (default: the first column)")
+    parser.add_argument("--include-likely", action="store_true", help="also add likely duplicates")
+    parser.add_argument("--dry-run", action="store_true", help="classify only, write nothing")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="parsing processes")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    try:
+        if args.manifest:
+            entries = entries_from_manifest(args.manifest, args.column)
+        else:
+            entries = entries_from_directory(args.directory, args.column)
+    except (OSError, ValueError) as e:
+        logging.error("Error reading entries: %s", e)
+        return 1
+    if not entries:
+        logging.error("No CSV files to load")
+        return 1
+
+    rows = []
+    planned = {}
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        # Parsing runs ahead in the pool while earlier files are written
+        futures = [pool.submit(parse_entry, entry) for entry in entries]
+        for entry, future in zip(entries, futures):
+            row = {"client": entry.client, "file": os.path.basename(entry.path), "rows": 0, "error": ""}
+            entry_started = time.perf_counter()
+            try:
+                prepared = future.result()
+                row["rows"] = len(prepared)
+                row.update(load_entry(entry, prepared, args.include_likely, args.dry_run, planned))
+            except Exception as e:
+                row["error"] = f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"
+            row["seconds"] = round(time.perf_counter() - entry_started, 2)
+            rows.append(row)
+    elapsed = time.perf_counter() - started
+
+    summary = pd.DataFrame(rows).fillna(0)
+    failed = summary[summary["error"] != ""]
+    print(summary.drop(columns="error").to_string(index=False))
+    print()
+    total_rows = int(summary["rows"].sum())
+    print(f"Files: {len(summary)}  Clients: {summary['client'].nunique()}  Failed: {len(failed)}")
+    print(f"Names: {total_rows}  {'Would insert' if args.dry_run else 'Inserted'}: "
+          f"{int(summary.get('inserted', pd.Series(dtype=int)).sum())}")
+    print(f"Wall time: {elapsed:.1f}s  Throughput: {total_rows / elapsed if elapsed else 0:.0f} names/s")
+    for _, row in failed.iterrows():
+        print(f"  {row['client']} ({row['file']}): {row['error']}")
+    return 1 if len(failed) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+import requests
+
+import diagnostics
+
+# Overridable so the client can be pointed at a local mock server
+API_BASE = os.environ.get("BEEHIIV_API_BASE", "https://api.beehiiv.com/v2")
+PAGE_SIZE = 100
+TIMEOUT_SECONDS = 30
+# Stats requests in flight at once, and the overall request rate they share
+STATS_CONCURRENCY = int(os.environ.get("BEEHIIV_CONCURRENCY", 4))
+REQUESTS_PER_SECOND = float(os.environ.get("BEEHIIV_REQUESTS_PER_SECOND", 5))
+MAX_RETRIES = 3
+STATS_FIELDS = ["active_subscriptions", "average_open_rate", "average_click_rate", "total_sent"]
+
+
+def _headers(api_key: Optional[str] = None) -> dict:
+    return {"Authorization": f"Bearer {api_key or os.environ.get('BEEHIIV_API_KEY')}"}
+
+
+# Every publication in the workspace, following Beehiiv's pagination.
+# Raises requests.RequestException on any failed page.
+def fetch_publications(api_key: Optional[str] = None, session: Optional[requests.Session] = None) -> List[dict]:
+    http = session or requests
+    querystring = {"limit": PAGE_SIZE, "direction": "desc", "order_by": "created"}
+    all_publications = []
+    current_page = 1
+    total_pages = 1
+
+    while current_page <= total_pages:
+        querystring["page"] = current_page
+        with diagnostics.timed("beehiiv", "GET /publications", page=current_page) as op:
+            response = http.get(
+                f"{API_BASE}/publications",
+                headers=_headers(api_key),
+                params=querystring,
+                timeout=TIMEOUT_SECONDS
+            )
+            response.raise_for_status()
+            data = response.json()
+            op["rows"] = len(data.get('data', []))
+        total_pages = data.get('total_pages', 1)
+        all_publications.extend(data.get('data', []))
+        current_page += 1
+
+    return all_publications
+
+
+# Name and id columns, as shown in the import views
+def publications_frame(publications: List[dict]) -> pd.DataFrame:
+    return pd.DataFrame(
+        [{"publication_name": pub["name"], "publication_id": pub["id"]} for pub in publications],
+        columns=["publication_name", "publication_id"]
+    )
+
+
+# Spaces calls from any number of threads at least 1/rate seconds apart
+class RateLimiter:
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def _fetch_stats(publication_id: str, api_key: Optional[str], limiter: RateLimiter,
+                 local: threading.local) -> dict:
+    if not hasattr(local, "session"):
+        local.session = requests.Session()
+    for attempt in range(MAX_RETRIES):
+        limiter.wait()
+        with diagnostics.timed("beehiiv", "GET /publications/{id}", publication_id=publication_id) as op:
+            response = local.session.get(
+                f"{API_BASE}/publications/{publication_id}",
+                headers=_headers(api_key),
+                params={"expand[]": "stats"},
+                timeout=TIMEOUT_SECONDS
+            )
+            op["status"] = response.status_code
+        if response.status_code != 429 or attempt == MAX_RETRIES - 1:
+            break
+        # Rate limited: back off for as long as Beehiiv asks
+        time.sleep(float(response.headers.get("Retry-After", 1)))
+    response.raise_for_status()
+    stats = (response.json().get("data") or {}).get("stats") or {}
+    return {"publication_id": publication_id, **{field: stats.get(field) for field in STATS_FIELDS}}
+
+
+# Stats for each publication, fetched with bounded concurrency and a shared
+# rate limit. Returns (stats rows, {publication_id: error}) so one failing
+# publication does not lose the rest.
+def fetch_publication_stats(publication_ids: Iterable[str], api_key: Optional[str] = None,
+                            concurrency: int = STATS_CONCURRENCY,
+                            rate: float = REQUESTS_PER_SECOND) -> Tuple[List[dict], Dict[str, str]]:
+    limiter = RateLimiter(rate)
+    local = threading.local()
+    results, errors = [], {}
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="beehiiv-stats") as pool:
+        futures = {
+            pool.submit(_fetch_stats, publication_id, api_key, limiter, local): publication_id
+            for publication_id in publication_ids
+        }
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except (requests.RequestException, ValueError) as e:
+                errors[futures[future]] = str(e)
+    return results, errors
@@ -0,0 +1,168 @@
+import os
+import time
+import pickle
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# "memory" keeps results per process, "sqlite" shares them (and invalidations)
+# between every server process on the host, "none" disables caching
+BACKEND = os.environ.get("NIAB_CACHE_BACKEND", "memory")
+TTL_SECONDS = float(os.environ.get("NIAB_CACHE_TTL", 30))
+MAX_ENTRIES = int(os.environ.get("NIAB_CACHE_MAX_ENTRIES", 256))
+SQLITE_PATH = os.environ.get(
+    "NIAB_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".niab_cache.sqlite")
+)
+
+_MISSING = object()
+
+
+# In-process LRU with per-entry expiry and per-namespace versions
+class LRUCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def version(self, namespace: str) -> int:
+        with self._lock:
+            return self._versions.get(namespace, 0)
+
+    def bump(self, namespace: str) -> None:
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+            # Entries under the old version can never be read again
+            for key in [key for key in self._entries if key.startswith(namespace + ":")]:
+                del self._entries[key]
+
+
+# Cache shared by all processes on the host through one SQLite file. Versions
+# live in the file, so a write on any replica invalidates reads on all of them.
+# Versioned keys never change meaning, so a local LRU can front the file.
+class SQLiteCache:
+    def __init__(self, path: str = SQLITE_PATH, max_entries: int = MAX_ENTRIES):
+        self.path = path
+        self.local = LRUCache(max_entries)
+        self._thread = threading.local()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS versions (namespace TEXT PRIMARY KEY, version INTEGER)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._thread, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._thread.conn = conn
+        return conn
+
+    def get(self, key: str) -> Any:
+        value = self.local.get(key)
+        if value is not _MISSING:
+            return value
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            return _MISSING
+        value = pickle.loads(row[0])
+        self.local.set(key, value, row[1] - time.time())
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self.local.set(key, value, ttl)
+        self._connect().execute(
+            "INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), time.time() + ttl)
+        )
+
+    def version(self, namespace: str) -> int:
+        row = self._connect().execute(
+            "SELECT version FROM versions WHERE namespace = ?", (namespace,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, namespace: str) -> None:
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO versions (namespace, version) VALUES (?, 1) "
+            "ON CONFLICT(namespace) DO UPDATE SET version = version + 1",
+            (namespace,)
+        )
+        conn.execute("DELETE FROM entries WHERE key LIKE ? OR expires_at < ?", (namespace + ":%", time.time()))
+        self.local.bump(namespace)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None and BACKEND != "none":
+            _backend = SQLiteCache() if BACKEND == "sqlite" else LRUCache()
+        return _backend
+
+
+# Return a cached loader result, calling the loader on a miss. Cached values
+# are shared between sessions and must be treated as read-only.
+def cached(namespace: str, loader: Callable, *args, ttl: Optional[float] = None) -> Any:
+    backend = get_backend()
+    if backend is None:
+        return loader(*args)
+    try:
+        # Qualified names are stable across processes, unlike function reprs
+        loader_name = f"{loader.__module__}.{loader.__qualname__}"
+        key = f"{namespace}:{backend.version(namespace)}:{loader_name}:{args!r}"
+        value = backend.get(key)
+    except sqlite3.Error as e:
+        logger.warning("Cache read failed for %s: %s", namespace, e)
+        return loader(*args)
+    if value is not _MISSING:
+        return value
+    value = loader(*args)
+    try:
+        backend.set(key, value, TTL_SECONDS if ttl is None else ttl)
+    except sqlite3.Error as e:
+        logger.warning("Cache write failed for %s: %s", namespace, e)
+    return value
+
+
+# Drop every cached result for the namespaces, in this process and (with the
+# shared backend) every other one
+def invalidate(*namespaces: str) -> None:
+    backend = get_backend()
+    if backend is None:
+        return
+    for namespace in namespaces:
+        try:
+            backend.bump(namespace)
+        except sqlite3.Error as e:
+            logger.warning("Cache invalidation failed for %s: %s", namespace, e)
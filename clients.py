@@ -0,0 +1,58 @@
+import bisect
+from typing import Iterable, List, Optional
+
+import cache
+import db
+import snapshot
+
+# Sorts after any character a client name can contain, to close prefix ranges
+_PREFIX_END = "\U0010ffff"
+
+
+# Every client known to the publications, ABM and links tables, sorted once
+# so pickers reuse the same option lists and prefix lookups are a bisect
+class ClientRegistry:
+    def __init__(self, names: Iterable[str]):
+        self.names: List[str] = sorted({name for name in names if name}, key=lambda name: (name.casefold(), name))
+        self._keys = [name.casefold() for name in self.names]
+        self._members = frozenset(self.names)
+        self._choices = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._members
+
+    # Option list for a picker, headed by a blank or "All Clients" entry
+    def choices(self, first: str = "") -> List[str]:
+        if first not in self._choices:
+            self._choices[first] = [first] + self.names
+        return self._choices[first]
+
+    # The registered spelling of a name, matched case-insensitively
+    def find(self, name: str) -> Optional[str]:
+        key = (name or "").strip().casefold()
+        index = bisect.bisect_left(self._keys, key)
+        if key and index < len(self._keys) and self._keys[index] == key:
+            return self.names[index]
+        return None
+
+    # Clients whose names start with the prefix, case-insensitively
+    def starting_with(self, prefix: str, limit: Optional[int] = None) -> List[str]:
+        key = (prefix or "").strip().casefold()
+        start = bisect.bisect_left(self._keys, key)
+        end = bisect.bisect_left(self._keys, key + _PREFIX_END, lo=start)
+        if limit is not None:
+            end = min(end, start + limit)
+        return self.names[start:end]
+
+
+def _load_registry() -> ClientRegistry:
+    clients = snapshot.load("clients", db.load_clients)
+    return ClientRegistry(clients.get("client_name", []))
+
+
+# Shared registry, rebuilt after any write that can add a client
+def get_registry() -> ClientRegistry:
+    return cache.cached("clients", _load_registry)
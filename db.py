@@ -0,0 +1,631 @@
+import os
+import logging
+import datetime
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator, NamedTuple, Optional, Sequence
+
+import pandas as pd
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+import cache
+import diagnostics
+
+logger = logging.getLogger(__name__)
+
+
+# Row types for the bulk methods
+class PublicationRow(NamedTuple):
+    client_name: str
+    publication_name: str
+    publication_id: str
+
+
+class ImportResult(NamedTuple):
+    added: list
+    # publication_id -> the active mapping that blocked it
+    conflicts: dict
+
+
+# Statements registered once per pooled connection with PREPARE and run with
+# EXECUTE. Each entry is (parameter types, statement body using $n placeholders).
+STATEMENTS = {
+    "load_publications": ((), """
+        SELECT ranked_data.client_name,
+            ranked_data.publication_id,
+            ranked_data.publication_name,
+            ranked_data.last_modified
+        FROM ( SELECT cp.publication_name,
+                cp.publication_id,
+                cp.client_name,
+                cp.remove,
+                cp.last_modified,
+                row_number() OVER (PARTITION BY cp.publication_id ORDER BY cp.last_modified DESC) AS rn
+            FROM niab.client_publication cp) ranked_data
+        WHERE ranked_data.rn = 1 AND ranked_data.remove = false
+        ORDER BY ranked_data.last_modified DESC
+    """),
+    "publications_as_of": (("timestamp", "text"), """
+        WITH RECURSIVE ids AS (
+            (SELECT publication_id FROM niab.client_publication ORDER BY publication_id LIMIT 1)
+            UNION ALL
+            SELECT (
+                SELECT cp.publication_id FROM niab.client_publication cp
+                WHERE cp.publication_id > ids.publication_id
+                ORDER BY cp.publication_id LIMIT 1
+            )
+            FROM ids
+            WHERE ids.publication_id IS NOT NULL
+        )
+        SELECT h.client_name, h.publication_id, h.publication_name, h.last_modified
+        FROM ids
+        CROSS JOIN LATERAL (
+            SELECT cp.client_name, cp.publication_id, cp.publication_name, cp.remove, cp.last_modified
+            FROM niab.client_publication cp
+            WHERE cp.publication_id = ids.publication_id AND cp.last_modified <= $1
+            ORDER BY cp.last_modified DESC
+            LIMIT 1
+        ) h
+        WHERE NOT h.remove AND ($2::text IS NULL OR h.client_name = $2)
+        ORDER BY h.client_name, h.publication_name
+    """),
+    "publication_as_of": (("text", "timestamp"), """
+        SELECT client_name, publication_id, publication_name, remove, last_modified
+        FROM niab.client_publication
+        WHERE publication_id = $1 AND last_modified <= $2
+        ORDER BY last_modified DESC
+        LIMIT 1
+    """),
+    "publication_changes": (("timestamp", "text", "bigint", "text", "text", "int"), """
+        SELECT h.last_modified, h.publication_id, h.version, h.publication_name, h.client_name,
+            h.previous_name, h.previous_client,
+            CASE
+                WHEN h.version = 1 THEN 'added'
+                WHEN h.remove AND NOT h.previous_remove THEN 'removed'
+                WHEN NOT h.remove AND h.previous_remove THEN 'restored'
+                WHEN h.remove THEN 'removed again'
+                WHEN h.client_name <> h.previous_client AND h.publication_name <> h.previous_name
+                    THEN 'reassigned and renamed'
+                WHEN h.client_name <> h.previous_client THEN 'reassigned'
+                WHEN h.publication_name <> h.previous_name THEN 'renamed'
+                ELSE 'unchanged'
+            END AS change
+        FROM (
+            SELECT cp.publication_id, cp.publication_name, cp.client_name, cp.remove, cp.last_modified,
+                LAG(cp.client_name) OVER w AS previous_client,
+                LAG(cp.publication_name) OVER w AS previous_name,
+                LAG(cp.remove) OVER w AS previous_remove,
+                row_number() OVER w AS version
+            FROM niab.client_publication cp
+            -- LAG and row_number only look at earlier rows, so history after the
+            -- cursor can be skipped before the window runs
+            WHERE ($5::text IS NULL OR cp.publication_id = $5)
+                AND ($1::timestamp IS NULL OR cp.last_modified <= $1)
+            -- Rows sharing a last_modified are ordered by their contents, so
+            -- version numbers and the keyset cursor are stable across pages
+            WINDOW w AS (PARTITION BY cp.publication_id
+                ORDER BY cp.last_modified, cp.remove, cp.client_name, cp.publication_name)
+        ) h
+        WHERE ($1::timestamp IS NULL OR (h.last_modified, h.publication_id, h.version) < ($1, $2, $3))
+            AND ($4::text IS NULL OR h.client_name = $4 OR h.previous_client = $4)
+        ORDER BY h.last_modified DESC, h.publication_id DESC, h.version DESC
+        LIMIT $6
+    """),
+    "load_catalogue": ((), """
+        SELECT publication_name, publication_id, synced_at
+        FROM niab.beehiiv_catalogue
+        ORDER BY first_seen DESC, publication_name
+    """),
+    "upsert_catalogue": (("text[]", "text[]", "timestamp"), """
+        INSERT INTO niab.beehiiv_catalogue AS c (publication_id, publication_name, first_seen, synced_at)
+        SELECT u.publication_id, u.publication_name, $3, $3
+        FROM unnest($1, $2) AS u(publication_id, publication_name)
+        ON CONFLICT (publication_id) DO UPDATE
+            SET publication_name = EXCLUDED.publication_name, synced_at = EXCLUDED.synced_at
+            WHERE c.publication_name IS DISTINCT FROM EXCLUDED.publication_name
+        RETURNING (xmax = 0) AS inserted
+    """),
+    "prune_catalogue": (("text[]",), """
+        DELETE FROM niab.beehiiv_catalogue
+        WHERE publication_id <> ALL($1)
+    """),
+    "record_catalogue_sync": (("timestamp", "int", "int", "int", "int", "int"), """
+        INSERT INTO niab.beehiiv_sync_log (started_at, duration_ms, fetched, inserted, updated, removed)
+        VALUES ($1, $2, $3, $4, $5, $6)
+    """),
+    "last_catalogue_sync": ((), """
+        SELECT started_at, duration_ms, fetched, inserted, updated, removed
+        FROM niab.beehiiv_sync_log
+        ORDER BY started_at DESC
+        LIMIT 1
+    """),
+    "stale_publication_stats": (("timestamp", "int"), """
+        SELECT latest.publication_id
+        FROM (
+            SELECT DISTINCT ON (cp.publication_id) cp.publication_id, cp.remove
+            FROM niab.client_publication cp
+            ORDER BY cp.publication_id, cp.last_modified DESC
+        ) latest
+        LEFT JOIN niab.beehiiv_publication_stats s ON s.publication_id = latest.publication_id
+        WHERE NOT latest.remove AND (s.fetched_at IS NULL OR s.fetched_at < $1)
+        ORDER BY s.fetched_at NULLS FIRST
+        LIMIT $2
+    """),
+    "upsert_publication_stats": (("text[]", "int[]", "numeric[]", "numeric[]", "bigint[]", "timestamp"), """
+        INSERT INTO niab.beehiiv_publication_stats AS s
+        (publication_id, active_subscriptions, average_open_rate, average_click_rate, total_sent, fetched_at, error)
+        SELECT u.*, $6, NULL
+        FROM unnest($1, $2, $3, $4, $5)
+            AS u(publication_id, active_subscriptions, average_open_rate, average_click_rate, total_sent)
+        ON CONFLICT (publication_id) DO UPDATE
+            SET active_subscriptions = EXCLUDED.active_subscriptions,
+                average_open_rate = EXCLUDED.average_open_rate,
+                average_click_rate = EXCLUDED.average_click_rate,
+                total_sent = EXCLUDED.total_sent,
+                fetched_at = EXCLUDED.fetched_at,
+                error = NULL
+    """),
+    "record_publication_stats_errors": (("text[]", "text[]", "timestamp"), """
+        INSERT INTO niab.beehiiv_publication_stats AS s (publication_id, fetched_at, error)
+        SELECT u.publication_id, $3, u.error
+        FROM unnest($1, $2) AS u(publication_id, error)
+        ON CONFLICT (publication_id) DO UPDATE
+            SET fetched_at = EXCLUDED.fetched_at, error = EXCLUDED.error
+    """),
+    "load_publication_stats": ((), """
+        SELECT publication_id, active_subscriptions, average_open_rate, average_click_rate,
+            total_sent, fetched_at
+        FROM niab.beehiiv_publication_stats
+        WHERE error IS NULL OR active_subscriptions IS NOT NULL
+    """),
+    "load_abm_data": ((), """
+        SELECT client_name, company, to_be_tracked, company_added_date
+        FROM niab.client_abm_tracking
+        ORDER BY client_name, company_added_date DESC
+    """),
+    "load_links_data": ((), """
+        SELECT client_name, link_to_track, still_tracking, submitted_timestamp
+        FROM niab.client_engaged_leads_link
+        ORDER BY client_name DESC
+    """),
+    "load_clients": ((), """
+        SELECT client_name FROM niab.client_publication
+        UNION
+        SELECT client_name FROM niab.client_abm_tracking
+        UNION
+        SELECT client_name FROM niab.client_engaged_leads_link
+    """),
+    "insert_publication": (("text", "text", "text", "boolean", "timestamp"), """
+        INSERT INTO niab.client_publication
+        (client_name, publication_name, publication_id, remove, last_modified)
+        VALUES ($1, $2, $3, $4, $5)
+    """),
+    "insert_publications": (("text[]", "text[]", "text[]", "timestamp"), """
+        INSERT INTO niab.client_publication
+        (client_name, publication_name, publication_id, remove, last_modified)
+        SELECT u.client_name, u.publication_name, u.publication_id, FALSE, $4
+        FROM unnest($1, $2, $3) AS u(client_name, publication_name, publication_id)
+    """),
+    "lock_publication_ids": (("text[]",), """
+        SELECT pg_advisory_xact_lock(hashtext('niab.client_publication:' || u.publication_id))
+        FROM unnest($1) WITH ORDINALITY AS u(publication_id, n)
+        ORDER BY u.n
+    """),
+    "active_publications_for_ids": (("text[]",), """
+        SELECT latest.publication_id, latest.client_name, latest.publication_name
+        FROM (
+            SELECT DISTINCT ON (cp.publication_id) cp.publication_id, cp.client_name, cp.publication_name, cp.remove
+            FROM niab.client_publication cp
+            WHERE cp.publication_id = ANY($1)
+            ORDER BY cp.publication_id, cp.last_modified DESC
+        ) latest
+        WHERE NOT latest.remove
+    """),
+    "load_client_companies": (("text",), """
+        SELECT company
+        FROM niab.client_abm_tracking
+        WHERE client_name = $1
+    """),
+    "insert_company": (("text", "text", "boolean"), """
+        INSERT INTO niab.client_abm_tracking
+        (client_name, company, to_be_tracked, company_added_date)
+        VALUES ($1, $2, $3, CURRENT_DATE)
+    """),
+    "insert_companies": (("text", "text[]", "boolean"), """
+        INSERT INTO niab.client_abm_tracking
+        (client_name, company, to_be_tracked, company_added_date)
+        SELECT $1, u.company, $3, CURRENT_DATE
+        FROM unnest($2) AS u(company)
+    """),
+    "set_companies_tracking": (("text", "text[]", "boolean"), """
+        UPDATE niab.client_abm_tracking
+        SET to_be_tracked = $3
+        WHERE client_name = $1 AND company = ANY($2) AND to_be_tracked IS DISTINCT FROM $3
+    """),
+    "load_client_links": (("text",), """
+        SELECT link_to_track
+        FROM niab.client_engaged_leads_link
+        WHERE client_name = $1
+    """),
+    "insert_link": (("text", "text"), """
+        INSERT INTO niab.client_engaged_leads_link
+        (client_name, link_to_track, still_tracking)
+        VALUES ($1, $2, TRUE)
+    """),
+    "insert_links": (("text", "text[]"), """
+        INSERT INTO niab.client_engaged_leads_link
+        (client_name, link_to_track, still_tracking)
+        SELECT $1, u.link_to_track, TRUE
+        FROM unnest($2) AS u(link_to_track)
+    """),
+}
+
+
+# Cached datasets each write statement makes stale
+INVALIDATES = {
+    "insert_publication": ("publications", "clients"),
+    "insert_publications": ("publications", "clients"),
+    "insert_company": ("abm", "clients"),
+    "insert_companies": ("abm", "clients"),
+    "set_companies_tracking": ("abm",),
+    "insert_link": ("links", "clients"),
+    "insert_links": ("links", "clients"),
+    "upsert_catalogue": ("catalogue",),
+    "prune_catalogue": ("catalogue",),
+    "upsert_publication_stats": ("stats",),
+    "record_publication_stats_errors": ("stats",),
+}
+
+
+# Connection that remembers which statements have been prepared on it and
+# which cached datasets its open transaction has written to
+class PreparedConnection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        # Statements that could not be prepared (e.g. a missing table), with the error
+        self.unavailable = {}
+        self.touched = set()
+
+    def prepare_statements(self):
+        missing = [name for name in STATEMENTS if name not in self.prepared and name not in self.unavailable]
+        if not missing:
+            return
+        cursor = self.cursor()
+        try:
+            for name in missing:
+                types, body = STATEMENTS[name]
+                signature = f"({', '.join(types)})" if types else ""
+                # One statement that cannot be prepared must not take the others down
+                cursor.execute("SAVEPOINT prepare_statement")
+                try:
+                    cursor.execute(f"PREPARE {name}{signature} AS {body}")
+                    cursor.execute("RELEASE SAVEPOINT prepare_statement")
+                    self.prepared.add(name)
+                except psycopg2.ProgrammingError as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT prepare_statement")
+                    self.unavailable[name] = str(e).strip()
+                    logger.warning("Could not prepare %s: %s", name, self.unavailable[name])
+            # PREPARE is session scoped, commit so the names survive a later rollback
+            self.commit()
+        except Exception:
+            self.rollback()
+            self.prepared.clear()
+            raise
+        finally:
+            cursor.close()
+
+
+_pool = None
+# Loaders run concurrently (loaders.gather), so the pool is created under a lock
+_pool_lock = threading.Lock()
+# One slot per pooled connection. ThreadedConnectionPool raises as soon as it
+# is exhausted, so callers wait here for a free connection instead.
+_pool_slots = None
+POOL_TIMEOUT_SECONDS = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+
+
+# Lazily create the process-wide connection pool
+def get_pool():
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is None:
+            maxconn = int(os.environ.get("DB_POOL_MAX", 10))
+            _pool = ThreadedConnectionPool(
+                int(os.environ.get("DB_POOL_MIN", 1)),
+                maxconn,
+                dbname=os.environ.get("DB_NAME"),
+                user=os.environ.get("DB_USER"),
+                password=os.environ.get("DB_PASSWORD"),
+                host=os.environ.get("DB_HOST"),
+                port=os.environ.get("DB_PORT"),
+                connect_timeout=int(os.environ.get("DB_CONNECT_TIMEOUT", 5)),
+                connection_factory=PreparedConnection,
+            )
+            _pool_slots = threading.BoundedSemaphore(maxconn)
+    return _pool
+
+
+# Borrow a pooled connection with all statements prepared
+@contextmanager
+def connection() -> Iterator[PreparedConnection]:
+    pool = get_pool()
+    if not _pool_slots.acquire(timeout=POOL_TIMEOUT_SECONDS):
+        raise PoolError(f"No database connection free after {POOL_TIMEOUT_SECONDS:g}s")
+    try:
+        conn = pool.getconn()
+        try:
+            conn.prepare_statements()
+            yield conn
+        except Exception:
+            conn.touched.clear()
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            # Broken connections are discarded so their replacement gets prepared again
+            pool.putconn(conn, close=bool(conn.closed))
+    finally:
+        _pool_slots.release()
+
+
+# Run a block of statements in one transaction, committing on success
+@contextmanager
+def transaction(cursor_factory=None) -> Iterator[psycopg2.extensions.cursor]:
+    with connection() as conn:
+        cursor = conn.cursor(cursor_factory=cursor_factory)
+        try:
+            yield cursor
+            conn.commit()
+        finally:
+            cursor.close()
+        if conn.touched:
+            cache.invalidate(*conn.touched)
+            conn.touched.clear()
+
+
+# EXECUTE a prepared statement on a cursor from transaction()
+def execute(cursor, name: str, params: Sequence = ()):
+    if name not in STATEMENTS:
+        raise KeyError(f"Unknown prepared statement: {name}")
+    if name in cursor.connection.unavailable:
+        raise psycopg2.ProgrammingError(f"Statement {name} is unavailable: {cursor.connection.unavailable[name]}")
+    cursor.connection.touched.update(INVALIDATES.get(name, ()))
+    with diagnostics.timed("sql", name, params=diagnostics.params_shape(params)) as op:
+        if params:
+            placeholders = ", ".join(["%s"] * len(params))
+            cursor.execute(f"EXECUTE {name} ({placeholders})", tuple(params))
+        else:
+            cursor.execute(f"EXECUTE {name}")
+        op["rows"] = cursor.rowcount
+    return cursor
+
+
+# Result as a DataFrame. Columns come from the statement, so an empty result
+# still has them and callers can filter it like any other.
+def _fetch_frame(name: str, params: Sequence = ()) -> pd.DataFrame:
+    with transaction(cursor_factory=RealDictCursor) as cursor:
+        execute(cursor, name, params)
+        return pd.DataFrame(cursor.fetchall(), columns=[column.name for column in cursor.description])
+
+
+# Stream a query through a server-side cursor, one DataFrame per chunk
+def iter_frames(sql: str, params: Sequence = (), chunk_size: int = 10000) -> Iterator[pd.DataFrame]:
+    with connection() as conn:
+        cursor = conn.cursor(name="niab_stream")
+        cursor.itersize = chunk_size
+        try:
+            cursor.execute(sql, tuple(params))
+            yielded = False
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                columns = [column.name for column in cursor.description]
+                if not rows:
+                    break
+                yielded = True
+                yield pd.DataFrame.from_records(rows, columns=columns)
+            if not yielded:
+                yield pd.DataFrame(columns=columns)
+        finally:
+            cursor.close()
+            if not conn.closed:
+                conn.rollback()
+
+
+# Loaders
+def load_publications() -> pd.DataFrame:
+    return _fetch_frame("load_publications")
+
+
+def load_abm_data() -> pd.DataFrame:
+    return _fetch_frame("load_abm_data")
+
+
+def load_links_data() -> pd.DataFrame:
+    return _fetch_frame("load_links_data")
+
+
+def load_clients() -> pd.DataFrame:
+    return _fetch_frame("load_clients")
+
+
+def load_client_companies(client_name: str) -> list:
+    with transaction() as cursor:
+        execute(cursor, "load_client_companies", (client_name,))
+        return [row[0] for row in cursor.fetchall()]
+
+
+def load_client_links(client_name: str) -> list:
+    with transaction() as cursor:
+        execute(cursor, "load_client_links", (client_name,))
+        return [row[0] for row in cursor.fetchall()]
+
+
+# Mapping of every publication, or one client's, as it stood at a moment
+def load_publications_as_of(as_of: datetime.datetime, client_name: Optional[str] = None) -> pd.DataFrame:
+    return _fetch_frame("publications_as_of", (as_of, client_name))
+
+
+def load_publication_as_of(publication_id: str, as_of: datetime.datetime) -> Optional[dict]:
+    with transaction(cursor_factory=RealDictCursor) as cursor:
+        execute(cursor, "publication_as_of", (publication_id, as_of))
+        return cursor.fetchone()
+
+
+# One page of the publication change log, newest first. Pass the
+# (last_modified, publication_id, version) of the previous page's last row
+# as after to continue from it.
+def load_publication_changes(after: Optional[tuple] = None, client_name: Optional[str] = None,
+                             publication_id: Optional[str] = None, limit: int = 50) -> pd.DataFrame:
+    after = after or (None, None, None)
+    return _fetch_frame("publication_changes", (*after, client_name, publication_id, limit))
+
+
+# Beehiiv catalogue, as last synced by sync_catalogue.py
+def load_catalogue() -> pd.DataFrame:
+    return _fetch_frame("load_catalogue")
+
+
+def last_catalogue_sync() -> Optional[dict]:
+    with transaction(cursor_factory=RealDictCursor) as cursor:
+        execute(cursor, "last_catalogue_sync")
+        return cursor.fetchone()
+
+
+# Mapped publications whose stats are missing or older than stale_before,
+# least recently fetched first
+def stale_publication_stats(stale_before: datetime.datetime, limit: Optional[int] = None) -> list:
+    with transaction() as cursor:
+        execute(cursor, "stale_publication_stats", (stale_before, limit))
+        return [row[0] for row in cursor.fetchall()]
+
+
+# Store fetched stats, and the failures so they wait for the next TTL too
+def save_publication_stats(stats: Sequence[dict], errors: dict, fetched_at: datetime.datetime) -> None:
+    with transaction() as cursor:
+        if stats:
+            execute(cursor, "upsert_publication_stats", (
+                [row["publication_id"] for row in stats],
+                [row["active_subscriptions"] for row in stats],
+                [row["average_open_rate"] for row in stats],
+                [row["average_click_rate"] for row in stats],
+                [row["total_sent"] for row in stats],
+                fetched_at,
+            ))
+        if errors:
+            execute(cursor, "record_publication_stats_errors", (list(errors), list(errors.values()), fetched_at))
+
+
+def load_publication_stats() -> pd.DataFrame:
+    return _fetch_frame("load_publication_stats")
+
+
+# Replace the catalogue with the given publications in one transaction and
+# log the run. Returns (inserted, updated, removed).
+def sync_catalogue(publications: Sequence[tuple], started_at: datetime.datetime) -> tuple:
+    # Beehiiv can repeat an id across pages; keep the first name seen
+    names = dict(reversed(list(publications)))
+    ids = list(names)
+    with transaction() as cursor:
+        execute(cursor, "upsert_catalogue", (ids, [names[i] for i in ids], started_at))
+        results = [row[0] for row in cursor.fetchall()]
+        inserted = sum(results)
+        updated = len(results) - inserted
+        execute(cursor, "prune_catalogue", (ids,))
+        removed = cursor.rowcount
+        duration_ms = int((datetime.datetime.now() - started_at).total_seconds() * 1000)
+        execute(cursor, "record_catalogue_sync", (
+            started_at, duration_ms, len(ids), inserted, updated, removed
+        ))
+    return inserted, updated, removed
+
+
+# Publication writes. Every change appends a new version row.
+def insert_publication(client_name: str, publication_name: str, publication_id: str,
+                       remove: bool = False) -> None:
+    with transaction() as cursor:
+        execute(cursor, "insert_publication", (
+            client_name, publication_name, publication_id, remove, datetime.datetime.now()
+        ))
+
+
+def insert_publications(rows: Iterable[PublicationRow]) -> int:
+    rows = [PublicationRow(*row) for row in rows]
+    if not rows:
+        return 0
+    with transaction() as cursor:
+        execute(cursor, "insert_publications", (
+            [row.client_name for row in rows],
+            [row.publication_name for row in rows],
+            [row.publication_id for row in rows],
+            datetime.datetime.now(),
+        ))
+        return cursor.rowcount
+
+
+# Add publications that have no active mapping, all in one transaction. Ids are
+# locked first so two imports of the same id cannot both pass the check.
+def import_publications(rows: Iterable[PublicationRow]) -> ImportResult:
+    rows_by_id = {}
+    for row in map(PublicationRow._make, rows):
+        rows_by_id.setdefault(row.publication_id, row)
+    if not rows_by_id:
+        return ImportResult([], {})
+    ids = sorted(rows_by_id)
+    with transaction(cursor_factory=RealDictCursor) as cursor:
+        execute(cursor, "lock_publication_ids", (ids,))
+        execute(cursor, "active_publications_for_ids", (ids,))
+        conflicts = {row["publication_id"]: dict(row) for row in cursor.fetchall()}
+        new_rows = [rows_by_id[i] for i in ids if i not in conflicts]
+        if new_rows:
+            execute(cursor, "insert_publications", (
+                [row.client_name for row in new_rows],
+                [row.publication_name for row in new_rows],
+                [row.publication_id for row in new_rows],
+                datetime.datetime.now(),
+            ))
+    return ImportResult([row.publication_id for row in new_rows], conflicts)
+
+
+# ABM writes
+def insert_company(client_name: str, company: str, track: bool = True) -> None:
+    with transaction() as cursor:
+        execute(cursor, "insert_company", (client_name, company, track))
+
+
+def insert_companies(client_name: str, companies: Iterable[str], track: bool = True) -> int:
+    companies = list(companies)
+    if not companies:
+        return 0
+    with transaction() as cursor:
+        execute(cursor, "insert_companies", (client_name, companies, track))
+        return cursor.rowcount
+
+
+# Set tracking for many of a client's companies in one UPDATE. Rows already in
+# the requested state are left alone, so the count is the number changed.
+def set_companies_tracking(client_name: str, companies: Iterable[str], track: bool) -> int:
+    companies = list(dict.fromkeys(companies))
+    if not companies:
+        return 0
+    with transaction() as cursor:
+        execute(cursor, "set_companies_tracking", (client_name, companies, track))
+        return cursor.rowcount
+
+
+# Sponsored link writes
+def insert_link(client_name: str, url: str) -> None:
+    with transaction() as cursor:
+        execute(cursor, "insert_link", (client_name, url))
+
+
+def insert_links(client_name: str, urls: Iterable[str]) -> int:
+    urls = list(urls)
+    if not urls:
+        return 0
+    with transaction() as cursor:
+        execute(cursor, "insert_links", (client_name, urls))
+        return cursor.rowcount
@@ -0,0 +1,174 @@
+import os
+import sys
+import json
+import time
+import logging
+import resource
+import threading
+import datetime
+from collections import deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from typing import Any, Iterator, List, Sequence
+
+import pandas as pd
+
+# Diagnostics mode: slow SQL, Beehiiv requests and page renders, plus
+# per-session memory samples, kept in memory for the admin page and written
+# as rotating JSONL under LOG_DIR
+ENABLED = os.environ.get("NIAB_DIAGNOSTICS") == "1"
+SLOW_MS = float(os.environ.get("NIAB_SLOW_MS", 500))
+SAMPLE_SECONDS = float(os.environ.get("NIAB_MEMORY_SAMPLE_SECONDS", 60))
+LOG_DIR = os.environ.get(
+    "NIAB_DIAGNOSTICS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".niab_diagnostics")
+)
+MAX_BYTES = int(os.environ.get("NIAB_DIAGNOSTICS_MAX_BYTES", 5 * 1024 * 1024))
+BACKUP_COUNT = 5
+HISTORY_SIZE = 500
+# Sessions not sampled for this long are dropped from the admin view
+SESSION_EXPIRY_SECONDS = 3600
+
+# Session state entries that hold per-session copies of data
+STATE_KEYS = ("data", "beehiiv_data", "edited_rows")
+
+_lock = threading.Lock()
+_slow_ops = deque(maxlen=HISTORY_SIZE)
+_sessions = {}
+_loggers = {}
+
+
+def _jsonl_logger(name: str) -> logging.Logger:
+    with _lock:
+        if name not in _loggers:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            handler = RotatingFileHandler(
+                os.path.join(LOG_DIR, f"{name}.jsonl"), maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            jsonl = logging.getLogger(f"{__name__}.{name}")
+            jsonl.setLevel(logging.INFO)
+            jsonl.propagate = False
+            jsonl.addHandler(handler)
+            _loggers[name] = jsonl
+        return _loggers[name]
+
+
+def _write(name: str, record: dict) -> None:
+    try:
+        _jsonl_logger(name).info(json.dumps(record, default=str))
+    except OSError:
+        # Diagnostics must never break the request being measured
+        pass
+
+
+# Describe a value by type and size only, so logs never hold row data
+def shape(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, pd.DataFrame):
+        return f"DataFrame[{len(value)}x{len(value.columns)}]"
+    if isinstance(value, (list, tuple, set, pd.Series)):
+        return f"{type(value).__name__}[{len(value)}]"
+    if isinstance(value, str):
+        return f"str[{len(value)}]"
+    return type(value).__name__
+
+
+def params_shape(params: Sequence) -> List[str]:
+    return [shape(param) for param in params]
+
+
+# Time an operation and record it if it exceeds SLOW_MS. The caller may add
+# details (such as row counts) to the yielded dict.
+@contextmanager
+def timed(kind: str, name: str, **details) -> Iterator[dict]:
+    if not ENABLED:
+        yield details
+        return
+    started = time.perf_counter()
+    try:
+        yield details
+    except Exception as e:
+        details["error"] = type(e).__name__
+        raise
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms >= SLOW_MS:
+            record = {
+                "at": datetime.datetime.now().isoformat(timespec="seconds"),
+                "kind": kind,
+                "name": name,
+                "ms": round(elapsed_ms, 1),
+                **details,
+            }
+            with _lock:
+                _slow_ops.append(record)
+            _write("slow_ops", record)
+
+
+# Approximate bytes held by a value
+def value_size(value: Any) -> int:
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(value_size(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+# Approximate memory held by a session's state
+def state_size(state: dict) -> int:
+    return sum(value_size(value) for value in state.values())
+
+
+# Resident set size now and at peak, in bytes
+def process_memory() -> dict:
+    # ru_maxrss is in KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    try:
+        with open("/proc/self/statm") as statm:
+            current = int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        current = peak
+    return {"rss_bytes": current, "peak_rss_bytes": peak}
+
+
+# Record the size of a session's state, at most once per SAMPLE_SECONDS
+def sample_session(session_id: str, state) -> None:
+    if not ENABLED:
+        return
+    now = time.time()
+    with _lock:
+        last = _sessions.get(session_id)
+        if last and now - last["sampled"] < SAMPLE_SECONDS:
+            return
+    values = state.to_dict() if hasattr(state, "to_dict") else dict(state)
+    record = {
+        "at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "session": session_id,
+        **{f"{key}_bytes": value_size(values.get(key)) for key in STATE_KEYS},
+        "total_bytes": state_size(values),
+        **process_memory(),
+    }
+    with _lock:
+        _sessions[session_id] = {"sampled": now, "record": record}
+        for stale in [sid for sid, entry in _sessions.items() if now - entry["sampled"] > SESSION_EXPIRY_SECONDS]:
+            del _sessions[stale]
+    _write("memory", record)
+
+
+# Recent slow operations, newest first
+def slow_operations() -> pd.DataFrame:
+    with _lock:
+        records = list(_slow_ops)
+    return pd.DataFrame(records[::-1])
+
+
+# Latest sample per live session, largest first
+def session_memory() -> pd.DataFrame:
+    with _lock:
+        records = [entry["record"] for entry in _sessions.values()]
+    frame = pd.DataFrame(records)
+    if frame.empty:
+        return frame
+    return frame.sort_values("total_bytes", ascending=False, ignore_index=True)
@@ -0,0 +1,142 @@
+import os
+import weakref
+import tempfile
+from typing import Iterable, Optional, Sequence, Tuple
+
+import pandas as pd
+
+import db
+
+CHUNK_SIZE = int(os.environ.get("NIAB_EXPORT_CHUNK_SIZE", 10000))
+
+FORMATS = {
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "CSV": ("csv", "text/csv"),
+}
+
+# Datasets that can be exported, as (query, client filter clause, column
+# types). The types fix the Parquet schema up front; inferring it from the
+# first chunk fails when a nullable column is all NULL in that chunk.
+DATASETS = {
+    "Publications": ("""
+        SELECT client_name, publication_id, publication_name, last_modified
+        FROM (
+            SELECT cp.*,
+                row_number() OVER (PARTITION BY cp.publication_id ORDER BY cp.last_modified DESC) AS rn
+            FROM niab.client_publication cp
+        ) ranked_data
+        WHERE rn = 1 AND remove = false {client_filter}
+        ORDER BY client_name, publication_name
+    """, "AND client_name = %s", [
+        ("client_name", "string"), ("publication_id", "string"),
+        ("publication_name", "string"), ("last_modified", "timestamp[us]"),
+    ]),
+    "ABM Lists": ("""
+        SELECT client_name, company, to_be_tracked, company_added_date
+        FROM niab.client_abm_tracking
+        {client_filter}
+        ORDER BY client_name, company_added_date DESC
+    """, "WHERE client_name = %s", [
+        ("client_name", "string"), ("company", "string"),
+        ("to_be_tracked", "bool"), ("company_added_date", "date32"),
+    ]),
+    "Sponsored Links": ("""
+        SELECT client_name, link_to_track, still_tracking, submitted_timestamp
+        FROM niab.client_engaged_leads_link
+        {client_filter}
+        ORDER BY client_name, submitted_timestamp DESC
+    """, "WHERE client_name = %s", [
+        ("client_name", "string"), ("link_to_track", "string"),
+        ("still_tracking", "bool"), ("submitted_timestamp", "timestamp[us]"),
+    ]),
+}
+
+
+# Chunks of a dataset, optionally for one client
+def iter_dataset(dataset: str, client: Optional[str] = None, chunk_size: int = CHUNK_SIZE) -> Iterable[pd.DataFrame]:
+    sql, client_filter, _ = DATASETS[dataset]
+    if client:
+        return db.iter_frames(sql.format(client_filter=client_filter), (client,), chunk_size)
+    return db.iter_frames(sql.format(client_filter=""), (), chunk_size)
+
+
+def write_parquet(frames: Iterable[pd.DataFrame], path: str, columns: Sequence[Tuple[str, str]]) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, pa.type_for_alias(alias)) for name, alias in columns])
+    rows = 0
+    writer = None
+    try:
+        for frame in frames:
+            table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, schema, compression="zstd")
+            writer.write_table(table)
+            rows += len(frame)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def write_csv(frames: Iterable[pd.DataFrame], path: str) -> int:
+    rows = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        for i, frame in enumerate(frames):
+            frame.to_csv(f, header=i == 0, index=False)
+            rows += len(frame)
+    return rows
+
+
+# Stream a dataset into a temporary file and return (path, row count)
+def export_to_file(dataset: str, fmt: str, client: Optional[str] = None) -> Tuple[str, int]:
+    extension, _ = FORMATS[fmt]
+    fd, path = tempfile.mkstemp(prefix="niab_export_", suffix=f".{extension}")
+    os.close(fd)
+    try:
+        frames = iter_dataset(dataset, client)
+        if extension == "parquet":
+            rows = write_parquet(frames, path, DATASETS[dataset][2])
+        else:
+            rows = write_csv(frames, path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, rows
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# A prepared export on disk. The file is removed when discard() is called or
+# when the object is garbage collected, e.g. with the session that held it.
+class ExportFile:
+    def __init__(self, path: str, rows: int, name: str, mime: str):
+        self.path = path
+        self.rows = rows
+        self.name = name
+        self.mime = mime
+        self._finalizer = weakref.finalize(self, _remove_file, path)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def discard(self) -> None:
+        self._finalizer()
+
+
+def export_filename(dataset: str, fmt: str, client: Optional[str] = None) -> str:
+    extension, _ = FORMATS[fmt]
+    parts = [dataset.lower().replace(" ", "_")]
+    if client:
+        parts.append("".join(c if c.isalnum() else "_" for c in client).strip("_").lower())
+    return f"{'_'.join(parts)}.{extension}"
@@ -0,0 +1,116 @@
+import re
+from typing import Iterable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import pandas as pd
+
+import db
+
+# Import row classifications
+NEW = "new"
+DUPLICATE = "duplicate"
+INVALID = "invalid"
+
+# Query parameters that only carry campaign or click tracking
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "gclsrc", "dclid", "msclkid", "yclid", "igshid", "twclid",
+    "mc_cid", "mc_eid", "_hsenc", "_hsmi", "mkt_tok", "_ga", "_gl",
+}
+TRACKING_PREFIXES = ("utm_",)
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def _is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+# A scheme prefix, as opposed to a host followed by a port ("localhost:8080")
+_SCHEME = re.compile(r"^([a-zA-Z][a-zA-Z0-9+.-]*):(?!\d+(?:[/?#]|$))")
+
+
+# The link as entered, trimmed and given https:// if it has no scheme; None
+# if it is not an http(s) URL. This is the form that gets stored.
+def clean_url(url) -> Optional[str]:
+    if not isinstance(url, str):
+        return None
+    url = url.strip()
+    if not url:
+        return None
+    scheme = _SCHEME.match(url)
+    if scheme is None:
+        url = "https://" + url
+    elif scheme.group(1).lower() not in DEFAULT_PORTS or not url[scheme.end():].startswith("//"):
+        return None
+    try:
+        parts = urlsplit(url)
+        parts.port
+    except ValueError:
+        return None
+    if not parts.hostname or " " in parts.hostname:
+        return None
+    return url
+
+
+# Canonical form of a link, used only as its duplicate key, or None if it is
+# not an http(s) URL. Fragments are dropped except app routes ("#/...").
+def canonicalize_url(url) -> Optional[str]:
+    url = clean_url(url)
+    if url is None:
+        return None
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = parts.hostname.rstrip(".")
+    if ":" in host:
+        host = f"[{host}]"
+
+    netloc = host
+    if parts.username:
+        netloc = f"{parts.username}@{netloc}"
+    if parts.port and parts.port != DEFAULT_PORTS[scheme]:
+        netloc = f"{netloc}:{parts.port}"
+
+    path = re.sub(r"/{2,}", "/", parts.path).rstrip("/")
+    query = urlencode(sorted(
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_tracking_param(name)
+    ))
+    fragment = parts.fragment if parts.fragment.startswith("/") else ""
+    return urlunsplit((scheme, netloc, path, query, fragment))
+
+
+# Split pasted text into candidate links, one per line or space separated.
+# Commas are valid in URLs, so they do not separate links.
+def parse_pasted_links(text: str) -> list:
+    return (text or "").split()
+
+
+# Classify links against the client's tracked links using a hashed index of canonical forms
+def classify_links(urls: Iterable, existing: Iterable) -> pd.DataFrame:
+    urls = pd.Series(list(urls), dtype=object).dropna().astype(str).str.strip()
+    urls = urls[urls != ""].reset_index(drop=True)
+    cleaned = urls.map(clean_url).astype(object)
+    canonical = urls.map(canonicalize_url).astype(object)
+
+    existing_canonical = pd.Series(list(existing), dtype=object).map(canonicalize_url).dropna()
+    existing_index = pd.Index(existing_canonical.drop_duplicates())
+
+    status = pd.Series(NEW, index=urls.index, dtype=object)
+    status[canonical.isna()] = INVALID
+    duplicate = canonical.notna() & (
+        pd.Series(existing_index.get_indexer(canonical.fillna("")) >= 0) | canonical.duplicated()
+    )
+    status[duplicate] = DUPLICATE
+    return pd.DataFrame({"url": urls, "link": cleaned, "canonical": canonical, "status": status})
+
+
+# Classify an import against what the client already tracks
+def plan_import(client: str, urls: Iterable) -> pd.DataFrame:
+    return classify_links(urls, db.load_client_links(client))
+
+
+# Links to write, in their cleaned rather than canonical form so tracking
+# parameters and the rest of the URL are kept
+def links_to_insert(plan: pd.DataFrame) -> list:
+    return plan.loc[plan["status"] == NEW, "link"].tolist()
@@ -0,0 +1,54 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import pandas as pd
+
+import cache
+import db
+import snapshot
+
+# Seconds a concurrently run loader may take before gather() gives up on it
+QUERY_TIMEOUT = float(os.environ.get("NIAB_QUERY_TIMEOUT", 20))
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("NIAB_GATHER_WORKERS", 8)), thread_name_prefix="niab-gather"
+)
+
+
+# Loaders shared by both entry points. Results are cached (see cache.py) and
+# snapshotted locally so they can be served while the database is slow or
+# unreachable. Returned frames are shared, treat them as read-only.
+def load_publications() -> pd.DataFrame:
+    return cache.cached("publications", lambda: snapshot.load("publications", db.load_publications))
+
+
+def load_abm_data() -> pd.DataFrame:
+    return cache.cached("abm", lambda: snapshot.load("abm", db.load_abm_data))
+
+
+def load_links_data() -> pd.DataFrame:
+    return cache.cached("links", lambda: snapshot.load("links", db.load_links_data))
+
+
+def load_catalogue() -> pd.DataFrame:
+    return cache.cached("catalogue", db.load_catalogue)
+
+
+def last_catalogue_sync():
+    return cache.cached("catalogue", db.last_catalogue_sync)
+
+
+# Run loaders concurrently, each on its own pooled connection, and return
+# their results in order. The first runs in the calling thread, so it may use
+# st.session_state. Any other still running after timeout seconds raises
+# TimeoutError (the query itself is left to finish in the background). When
+# the pool is busy, loaders wait in db.connection() for a free connection.
+def gather(*loaders: Callable, timeout: float = QUERY_TIMEOUT) -> list:
+    futures = [_executor.submit(loader) for loader in loaders[1:]]
+    deadline = time.monotonic() + timeout
+    results = [loaders[0]()]
+    for future in futures:
+        results.append(future.result(timeout=max(0.0, deadline - time.monotonic())))
+    return results
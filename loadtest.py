@@ -0,0 +1,235 @@
+import os
+import time
+import uuid
+import argparse
+import resource
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import psycopg2
+from dotenv import load_dotenv
+from streamlit.testing.v1 import AppTest
+
+from diagnostics import state_size
+
+# Drive the main.py pages headlessly with N concurrent AppTest sessions and
+# report rerun latency, peak database connections and memory per session.
+#
+#   python loadtest.py --sessions 20 --rounds 10
+#   python loadtest.py --sessions 5 --pages "ABM Lists" --writes
+#
+# Point the DB_* variables at a local Postgres. With --writes the ABM and
+# link scenarios submit rows prefixed "loadtest-", removed again at the end.
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+PAGES = ["Dashboard", "Publications", "ABM Lists", "Sponsored Links"]
+WRITE_PREFIX = "loadtest-"
+
+
+def _first_option(selectbox):
+    options = [option for option in selectbox.options if option and option != "All Clients"]
+    return options[0] if options else None
+
+
+def _widget(elements, label):
+    for element in elements:
+        if element.label == label:
+            return element
+    raise LookupError(f"No widget labelled {label!r}")
+
+
+# One interaction per page; each returns the AppTest after its rerun
+def dashboard_round(at, session, round_no, writes):
+    return at.run()
+
+
+def publications_round(at, session, round_no, writes):
+    # The data editor cannot be driven by AppTest, so search and refresh instead
+    search = _widget(at.text_input, "🔍 Search publications")
+    search.input("" if round_no % 2 else "a").run()
+    return _widget(at.button, "🔄 Refresh").click().run()
+
+
+def abm_round(at, session, round_no, writes):
+    upload_client = at.selectbox(key="upload_client")
+    client = _first_option(upload_client)
+    if client is None:
+        return at.run()
+    upload_client.select(client).run()
+    companies = "\n".join(f"{WRITE_PREFIX}{session}-{round_no}-{i}" for i in range(100))
+    at.file_uploader[0].upload("companies.csv", f"company\n{companies}\n".encode(), "text/csv").run()
+    if writes:
+        at = _widget(at.button, "Confirm Upload").click().run()
+    return at
+
+
+def links_round(at, session, round_no, writes):
+    select = _widget(at.selectbox, "Select Client")
+    client = _first_option(select)
+    if client is not None:
+        at = select.select(client).run()
+    if writes:
+        import_client = at.selectbox(key="import_link_client")
+        client = _first_option(import_client)
+        if client is not None:
+            import_client.select(client).run()
+            _widget(at.text_area, "Links").input(
+                f"https://{WRITE_PREFIX}{session}.example.com/{round_no}"
+            ).run()
+            at = _widget(at.button, "Import 1 Links").click().run()
+    return at
+
+
+SCENARIOS = {
+    "Dashboard": dashboard_round,
+    "Publications": publications_round,
+    "ABM Lists": abm_round,
+    "Sponsored Links": links_round,
+}
+
+
+def run_session(session, page, rounds, writes, timeout):
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.query_params["page"] = page
+    latencies = []
+    errors = []
+    started = time.perf_counter()
+    at.run()
+    latencies.append(time.perf_counter() - started)
+    for round_no in range(rounds):
+        started = time.perf_counter()
+        try:
+            at = SCENARIOS[page](at, session, round_no, writes)
+            if at.exception:
+                errors.append(at.exception[0].value.splitlines()[0])
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+        latencies.append(time.perf_counter() - started)
+    return {
+        "session": session,
+        "page": page,
+        "latencies": latencies,
+        "errors": errors,
+        "state_bytes": state_size(at.session_state.to_dict()),
+    }
+
+
+# A connection outside the app's pool, for monitoring and cleanup
+def admin_connection():
+    conn = psycopg2.connect(
+        dbname=os.environ.get("DB_NAME"),
+        user=os.environ.get("DB_USER"),
+        password=os.environ.get("DB_PASSWORD"),
+        host=os.environ.get("DB_HOST"),
+        port=os.environ.get("DB_PORT"),
+    )
+    conn.autocommit = True
+    return conn
+
+
+# Samples the number of backend connections to the app's database
+class ConnectionMonitor(threading.Thread):
+    def __init__(self, interval=0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.conn = admin_connection()
+
+    def run(self):
+        cursor = self.conn.cursor()
+        while not self.stopped.is_set():
+            cursor.execute("""
+                SELECT count(*) FROM pg_stat_activity
+                WHERE datname = current_database() AND pid <> pg_backend_pid()
+            """)
+            self.peak = max(self.peak, cursor.fetchone()[0])
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.conn.close()
+
+
+def remove_test_rows():
+    conn = admin_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM niab.client_abm_tracking WHERE company LIKE %s", (WRITE_PREFIX + "%",))
+            cursor.execute("DELETE FROM niab.client_engaged_leads_link WHERE link_to_track LIKE %s",
+                           (f"https://{WRITE_PREFIX}%",))
+    finally:
+        conn.close()
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return float("nan")
+    index = min(len(values) - 1, max(0, round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for main.py")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent simulated sessions")
+    parser.add_argument("--rounds", type=int, default=5, help="interactions per session")
+    parser.add_argument("--pages", nargs="+", default=PAGES, choices=PAGES,
+                        help="pages to drive; sessions are spread across them")
+    parser.add_argument("--writes", action="store_true", help="submit ABM uploads and links")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds allowed per rerun")
+    args = parser.parse_args()
+
+    load_dotenv()
+    monitor = ConnectionMonitor()
+    monitor.start()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+            futures = [
+                pool.submit(run_session, f"{i}-{uuid.uuid4().hex[:6]}", args.pages[i % len(args.pages)],
+                            args.rounds, args.writes, args.timeout)
+                for i in range(args.sessions)
+            ]
+            results = [future.result() for future in futures]
+    finally:
+        elapsed = time.perf_counter() - started
+        monitor.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    rows = []
+    for page in args.pages:
+        page_results = [result for result in results if result["page"] == page]
+        latencies = [latency for result in page_results for latency in result["latencies"]]
+        if not page_results:
+            continue
+        rows.append({
+            "page": page,
+            "sessions": len(page_results),
+            "reruns": len(latencies),
+            "p50_ms": round(percentile(latencies, 50) * 1000),
+            "p90_ms": round(percentile(latencies, 90) * 1000),
+            "p99_ms": round(percentile(latencies, 99) * 1000),
+            "max_ms": round(max(latencies) * 1000),
+            "errors": sum(len(result["errors"]) for result in page_results),
+            "state_kb": round(sum(r["state_bytes"] for r in page_results) / len(page_results) / 1024),
+        })
+    print(pd.DataFrame(rows).to_string(index=False))
+    print()
+    print(f"Sessions: {args.sessions}  Wall time: {elapsed:.1f}s")
+    print(f"Peak DB connections: {monitor.peak}")
+    # ru_maxrss is in KiB on Linux
+    print(f"Peak RSS growth per session: {(rss_after - rss_before) / args.sessions / 1024:.1f} MiB")
+    for result in results:
+        for error in result["errors"][:3]:
+            print(f"  session {result['session']} ({result['page']}): {error}")
+
+    if args.writes:
+        remove_test_rows()
+
+
+if __name__ == "__main__":
+    main()
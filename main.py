@@ -1,13 +1,24 @@
+import time
+_script_started = time.perf_counter()
+
 import streamlit as st
 import pandas as pd
-import requests
 import datetime
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import os
+import uuid
 from dotenv import load_dotenv
-import plotly.express as px
-from streamlit_option_menu import option_menu
+import abm
+import beehiiv
+import clients
+import db
+import diagnostics
+import export
+import links
+import loaders
+import publication_stats
+import snapshot
+import startup
+import writeback
 
 # Page configuration
 st.set_page_config(
@@ -20,13 +31,6 @@ st.set_page_config(
 # Load environment variables
 load_dotenv()
 
-# Database connection parameters
-DB_NAME = os.environ.get("DB_NAME")
-DB_USER = os.environ.get("DB_USER")
-DB_PASSWORD = os.environ.get("DB_PASSWORD")
-DB_HOST = os.environ.get("DB_HOST")
-DB_PORT = os.environ.get("DB_PORT")
-
 # Custom CSS
 st.markdown("""
 <style>
@@ -57,153 +61,170 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Database connection
-def get_db_connection():
-    return psycopg2.connect(
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        host=DB_HOST,
-        port=DB_PORT
-    )
-
-# Load data functions
-def load_publications():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("""
-     SELECT ranked_data.client_name,
-    ranked_data.publication_id,
-    ranked_data.publication_name,
-    ranked_data.last_modified
-   FROM ( SELECT cp.publication_name,
-            cp.publication_id,
-            cp.client_name,
-            cp.remove,
-            cp.last_modified,
-            row_number() OVER (PARTITION BY cp.publication_id ORDER BY cp.last_modified DESC) AS rn
-           FROM niab.client_publication cp) ranked_data
-  WHERE ranked_data.rn = 1 AND ranked_data.remove = false;
-  """)
-    data = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return pd.DataFrame(data)
-
-def load_abm_data():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("""
-        SELECT client_name, company, to_be_tracked, company_added_date
-        FROM niab.client_abm_tracking
-        ORDER BY client_name, company_added_date DESC
-    """)
-    data = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return pd.DataFrame(data)
-
-def load_links_data():
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("""
-        SELECT client_name, link_to_track, still_tracking, submitted_timestamp
-        FROM niab.client_engaged_leads_link
-        ORDER BY client_name DESC
-    """)
-    data = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return pd.DataFrame(data)
-
 # Initialize session state
+if 'startup_timer' not in st.session_state:
+    st.session_state.startup_timer = startup.StartupTimer(_script_started)
+    st.session_state.startup_timer.mark("imports")
 if 'data' not in st.session_state:
-    st.session_state.data = load_publications()
+    if startup.FAST_START:
+        # Serve the last snapshot at once and fetch fresh data in the background
+        cached = snapshot.read("publications")
+        st.session_state.data = cached.frame if cached else None
+        if cached:
+            st.session_state.data_saved_at = cached.saved_at
+            st.session_state.startup_timer.mark("snapshot")
+        st.session_state.data_future = startup.prefetch(loaders.load_publications)
+    else:
+        st.session_state.data = loaders.load_publications()
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex[:8]
 if 'beehiiv_data' not in st.session_state:
     st.session_state.beehiiv_data = None
 if 'edited_rows' not in st.session_state:
     st.session_state.edited_rows = {}
 if 'last_refresh' not in st.session_state:
     st.session_state.last_refresh = datetime.datetime.now()
+if 'write_ids' not in st.session_state:
+    st.session_state.write_ids = []
 
-# Add auto-refresh functionality
-def auto_refresh():
+# Swap in the background initial load once it is done. Only wait for it
+# when there is no snapshot to show in the meantime. A failed load is dropped
+# and retried here, so its error does not stick to the session.
+def session_data():
+    future = st.session_state.get('data_future')
+    if future is not None and (future.done() or st.session_state.data is None):
+        del st.session_state['data_future']
+        if future.exception() is None:
+            st.session_state.data = future.result()
+        else:
+            st.session_state.data = loaders.load_publications()
+        st.session_state.startup_timer.mark("initial_data")
+    return st.session_state.data
+
+# Publications for a page, reusing the initial load on a session's first page
+def current_publications():
+    if 'data_future' in st.session_state:
+        return session_data()
+    return loaders.load_publications()
+
+# Whether the session is still showing the startup snapshot while the live
+# load runs
+def showing_snapshot():
+    return 'data_future' in st.session_state
+
+# Block writes while pages are served from a snapshot
+def writes_blocked():
+    if snapshot.degraded():
+        st.error("The database is unreachable, so changes are disabled for now.")
+        return True
+    return False
+
+# Add auto-refresh functionality. Pages that have just loaded publications
+# pass them in rather than loading them again.
+def auto_refresh(publications=None):
     current_time = datetime.datetime.now()
     if 'last_refresh' not in st.session_state or (current_time - st.session_state.last_refresh).seconds >= 30:
-        st.session_state.data = load_publications()
+        st.session_state.pop('data_future', None)
+        st.session_state.data = publications if publications is not None else loaders.load_publications()
         st.session_state.last_refresh = current_time
 
 def fetch_beehiiv_publications():
     with st.spinner('Fetching publications from Beehiiv...'):
-        querystring = {"limit": 100, "direction": "desc", "order_by": "created"}
-        all_publications = []
-        current_page = 1
-        total_pages = 1
-
-        while current_page <= total_pages:
-            querystring["page"] = current_page
-            try:
-                response = requests.get(
-                    "https://api.beehiiv.com/v2/publications",
-                    headers={
-                        "Authorization": f"Bearer {os.environ.get('BEEHIIV_API_KEY')}"
-                    },
-                    params=querystring
-                )
-                response.raise_for_status()
-                data = response.json()
-                total_pages = data.get('total_pages', 1)
-                all_publications.extend(data.get('data', []))
-                current_page += 1
-            except Exception as e:
-                st.error(f"Error fetching publications from Beehiiv: {str(e)}")
-                return None
+        try:
+            all_publications = beehiiv.fetch_publications()
+        except Exception as e:
+            st.error(f"Error fetching publications from Beehiiv: {str(e)}")
+            return None
 
         if not all_publications:
             st.warning("No publications found in Beehiiv")
             return None
 
-        return pd.DataFrame([
-            {"publication_name": pub["name"], "publication_id": pub["id"]} 
-            for pub in all_publications
-        ])
+        return beehiiv.publications_frame(all_publications)
 
 def main():
+    from streamlit_option_menu import option_menu
+
+    timer = st.session_state.startup_timer
+
     # Sidebar
     with st.sidebar:
         # Logo removed for now
         st.markdown("---")
         
-        # Navigation menu
+        # Navigation menu, opening on the page named by ?page= if there is one
+        pages = ["Dashboard", "Publications", "ABM Lists", "Sponsored Links", "As Of", "Change Log", "Export"]
+        icons = ["house", "journal-text", "building", "link", "clock-history", "list-ul", "download"]
+        if diagnostics.ENABLED:
+            pages.append("Diagnostics")
+            icons.append("activity")
+        requested_page = st.query_params.get("page")
         selected = option_menu(
             menu_title="Navigation",
-            options=["Dashboard", "Publications", "ABM Lists", "Sponsored Links"],
-            icons=["house", "journal-text", "building", "link"],
+            options=pages,
+            icons=icons,
             menu_icon="cast",
-            default_index=0,
+            default_index=pages.index(requested_page) if requested_page in pages else 0,
+        )
+    timer.mark("shell")
+    
+    # Read-only banner while the database is unreachable
+    stale = snapshot.degraded()
+    if stale:
+        age = datetime.datetime.now() - stale.saved_at
+        st.warning(
+            f"⚠️ The database is unreachable. Showing read-only data saved "
+            f"{stale.saved_at:%d/%m/%Y %H:%M} ({int(age.total_seconds() // 60)} minutes old)."
         )
     
     # Main content area
-    if selected == "Dashboard":
-        show_dashboard()
-    elif selected == "Publications":
-        show_publications()
-    elif selected == "ABM Lists":
-        show_abm_lists()
-    elif selected == "Sponsored Links":
-        show_sponsored_links()
+    with diagnostics.timed("page", selected, session=st.session_state.session_id):
+        if selected == "Dashboard":
+            show_dashboard()
+        elif selected == "Publications":
+            show_publications()
+        elif selected == "ABM Lists":
+            show_abm_lists()
+        elif selected == "Sponsored Links":
+            show_sponsored_links()
+        elif selected == "As Of":
+            show_as_of()
+        elif selected == "Change Log":
+            show_change_log()
+        elif selected == "Export":
+            show_export()
+        elif selected == "Diagnostics":
+            show_diagnostics()
+    timer.mark("first_page")
+    diagnostics.sample_session(st.session_state.session_id, st.session_state)
+
+    if writeback.ENABLED:
+        with st.sidebar:
+            show_write_status()
+
+    # Startup timing report for the session's first run
+    if not timer.reported:
+        timer.log()
+        if os.environ.get("NIAB_STARTUP_REPORT") == "1":
+            with st.sidebar.expander("⏱️ Startup timing"):
+                st.dataframe(pd.DataFrame(timer.report()), hide_index=True, use_container_width=True)
 
 def show_dashboard():
-    auto_refresh()
     st.title("📊 Dashboard")
     
-    # Load all data
-    publications_df = load_publications()
-    abm_df = load_abm_data()
-    links_df = load_links_data()
+    # Load all data concurrently
+    try:
+        publications_df, abm_df, links_df, stats_df = loaders.gather(
+            current_publications, loaders.load_abm_data, loaders.load_links_data, publication_stats.load_stats
+        )
+    except TimeoutError:
+        st.error("Dashboard data is taking too long to load. Please try again shortly.")
+        return
+    auto_refresh(publications_df)
+    publications_df = publication_stats.with_stats(publications_df, stats_df)
     
     # Create dashboard layout
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4 = st.columns(4)
     
     with col1:
         st.metric("Total Publications", len(publications_df))
@@ -211,11 +232,15 @@ def show_dashboard():
         st.metric("Companies Tracked", len(abm_df))
     with col3:
         st.metric("Active Links", len(links_df))
+    with col4:
+        st.metric("Active Subscribers", f"{int(publications_df['active_subscriptions'].sum()):,}")
     
     # Charts
     col1, col2 = st.columns(2)
     
     with col1:
+        import plotly.express as px
+
         st.subheader("Publications by Client")
         fig = px.pie(publications_df, names='client_name', title='Publication Distribution')
         st.plotly_chart(fig, use_container_width=True)
@@ -224,15 +249,26 @@ def show_dashboard():
         st.subheader("Recent Activity")
         recent_pubs = publications_df.head(5)
         st.dataframe(recent_pubs, use_container_width=True)
+    
+    # Subscriber reach per client, from stats synced by sync_catalogue.py --stats
+    if publications_df['active_subscriptions'].notna().any():
+        st.subheader("Top Clients by Subscribers")
+        reach = (
+            publications_df.groupby('client_name', as_index=False)['active_subscriptions'].sum()
+            .nlargest(15, 'active_subscriptions')
+        )
+        fig = px.bar(reach, x='client_name', y='active_subscriptions',
+                     labels={'client_name': 'Client', 'active_subscriptions': 'Active Subscribers'})
+        st.plotly_chart(fig, use_container_width=True)
 
 def show_publications():
-    auto_refresh()
     st.title("📚 Publications Management")
+    auto_refresh()
     
     tab1, tab2 = st.tabs(["View Publications", "Import from Beehiiv"])
     
     with tab1:
-        publications_df = load_publications()
+        publications_df = current_publications()
         
         # Search and filter
         col1, col2, col3 = st.columns([2, 2, 1])
@@ -240,8 +276,7 @@ def show_publications():
             search_term = st.text_input("🔍 Search publications", placeholder="Search by name, client, or ID")
         with col2:
             if not publications_df.empty:
-                clients = sorted(publications_df['client_name'].unique())
-                selected_client = st.selectbox("Filter by Client", ["All Clients"] + list(clients))
+                selected_client = st.selectbox("Filter by Client", clients.get_registry().choices("All Clients"))
         with col3:
             st.markdown("<br>", unsafe_allow_html=True)
             if st.button("🔄 Refresh", use_container_width=True):
@@ -260,11 +295,21 @@ def show_publications():
         
         # Display publications with interactive features
         if not filtered_df.empty:
+            filtered_df = publication_stats.with_stats(filtered_df)
             # Initialize selection column
             filtered_df['select'] = False
             
-            # Add help text for editing
-            st.info("📝 Click on any field to edit. Changes are saved automatically.")
+            # The startup snapshot is read-only until the live load replaces it.
+            # Edits are matched to rows by position, and the rows can change then.
+            preliminary = showing_snapshot()
+            if preliminary:
+                st.info(
+                    f"⏳ Showing publications saved {st.session_state.data_saved_at:%d/%m/%Y %H:%M} "
+                    "while the latest data loads. Editing is enabled once it arrives; click Refresh."
+                )
+            else:
+                # Add help text for editing
+                st.info("📝 Click on any field to edit. Changes are saved automatically.")
             
             edited_df = st.data_editor(
                 filtered_df,
@@ -295,19 +340,40 @@ def show_publications():
                         required=True,
                         help="Click to edit publication ID"
                     ),
+                    "active_subscriptions": st.column_config.NumberColumn(
+                        "Subscribers",
+                        format="%d",
+                        disabled=True
+                    ),
+                    "average_open_rate": st.column_config.NumberColumn(
+                        "Open Rate",
+                        format="%.1f%%",
+                        disabled=True
+                    ),
+                    "average_click_rate": st.column_config.NumberColumn(
+                        "Click Rate",
+                        format="%.1f%%",
+                        disabled=True
+                    ),
+                    "total_sent": st.column_config.NumberColumn(
+                        "Emails Sent",
+                        format="%d",
+                        disabled=True
+                    ),
                     "select": st.column_config.CheckboxColumn(
                         "Select",
                         help="Select for deletion",
                         default=False
                     )
                 },
-                num_rows="dynamic",
+                num_rows="fixed" if preliminary else "dynamic",
+                disabled=preliminary,
                 key="publication_editor",
                 on_change=lambda: None  # Enable real-time editing
             )
             
             # Handle edited rows
-            if st.session_state.edited_rows != st.session_state.publication_editor:
+            if not preliminary and st.session_state.edited_rows != st.session_state.publication_editor:
                 edited_rows = st.session_state.publication_editor.get("edited_rows", {})
                 for idx, new_data in edited_rows.items():
                     old_data = filtered_df.iloc[idx].to_dict()
@@ -322,7 +388,7 @@ def show_publications():
             
             # Add action buttons for selected rows
             selected_rows = edited_df[edited_df['select'] == True]
-            if not selected_rows.empty:
+            if not preliminary and not selected_rows.empty:
                 col1, col2 = st.columns([4, 1])
                 with col2:
                     if st.button("🗑️ Delete Selected", use_container_width=True, type="primary"):
@@ -335,6 +401,10 @@ def show_publications():
                                 )
                             st.rerun()
             
+            # Stats are read from the database; this fetches those missing or past their TTL
+            if st.button("📈 Refresh Subscriber Stats") and not writes_blocked():
+                refresh_publication_stats()
+            
             # Show editing tips
             with st.expander("ℹ️ Editing Tips"):
                 st.markdown("""
@@ -350,20 +420,34 @@ def show_publications():
     with tab2:
         st.subheader("Import Publications from Beehiiv")
         
-        # Simple fetch button
-        if st.button("🔄 Fetch Publications from Beehiiv", type="primary", use_container_width=True):
+        # Publications come from the catalogue synced by sync_catalogue.py;
+        # a live fetch replaces it for this session
+        try:
+            catalogue = loaders.load_catalogue()
+        except Exception as e:
+            st.warning(f"Synced catalogue unavailable: {str(e)}")
+            catalogue = pd.DataFrame()
+        
+        if st.button("🔄 Fetch Live from Beehiiv", use_container_width=True):
             with st.spinner("Fetching publications from Beehiiv..."):
                 st.session_state.beehiiv_data = fetch_beehiiv_publications()
         
+        available = st.session_state.beehiiv_data
+        if available is None and not catalogue.empty:
+            last_sync = loaders.last_catalogue_sync()
+            if last_sync:
+                st.caption(f"Catalogue synced {last_sync['started_at']:%d/%m/%Y %H:%M}")
+            available = catalogue[['publication_name', 'publication_id']]
+        
         # Display and import section
-        if st.session_state.beehiiv_data is not None:
+        if available is not None:
             st.markdown("### Available Publications")
             
             # Simple search
             search = st.text_input("🔍 Search publications", placeholder="Filter by name")
             
             # Filter data
-            filtered_df = st.session_state.beehiiv_data.copy()
+            filtered_df = available.copy()
             if search:
                 filtered_df = filtered_df[
                     filtered_df['publication_name'].str.contains(search, case=False)
@@ -399,56 +483,93 @@ def show_publications():
                 if not selected_pubs.empty:
                     col1, col2 = st.columns([3, 1])
                     with col1:
-                        client_name = st.text_input("Client name for selected publications:")
+                        client_name = client_name_input("Client name for selected publications:")
                     with col2:
                         st.markdown("<br>", unsafe_allow_html=True)
-                        if st.button("Add Selected", type="primary", use_container_width=True) and client_name:
-                            with st.spinner("Adding publications..."):
-                                for _, pub in selected_pubs.iterrows():
-                                    add_publication(
-                                        client_name,
-                                        pub['publication_name'],
-                                        pub['publication_id']
-                                    )
-                                st.success(f"Added {len(selected_pubs)} publications to {client_name}")
-                                st.session_state.beehiiv_data = None
-                                st.rerun()
+                        add_clicked = st.button("Add Selected", type="primary", use_container_width=True)
+                    if add_clicked and client_name:
+                        import_publications(client_name, selected_pubs)
             else:
                 st.info("No publications found matching your search")
 
 def show_abm_lists():
-    auto_refresh()
     st.title("🏢 ABM List Management")
     
+    auto_refresh()
+    
+    try:
+        abm_df, registry = loaders.gather(loaders.load_abm_data, clients.get_registry)
+    except TimeoutError:
+        st.error("ABM lists are taking too long to load. Please try again shortly.")
+        return
+    
     tab1, tab2, tab3 = st.tabs(["View Lists", "Bulk Upload", "Add Company"])
     
     with tab1:
-        abm_df = load_abm_data()
-        clients = sorted(abm_df['client_name'].unique()) if not abm_df.empty else []
-        
         col1, col2 = st.columns([1, 3])
         with col1:
-            selected_client = st.selectbox("Select Client", [""] + clients)
+            selected_client = st.selectbox("Select Client", registry.choices())
         
         if selected_client:
             client_abm = abm_df[abm_df['client_name'] == selected_client]
-            st.dataframe(
-                client_abm,
+            with col2:
+                company_filter = st.text_input("🔍 Filter companies", key="abm_filter")
+            filtered_abm = client_abm
+            if company_filter:
+                filtered_abm = client_abm[
+                    client_abm['company'].str.contains(company_filter, case=False, regex=False)
+                ]
+            
+            edited_abm = st.data_editor(
+                filtered_abm.assign(select=False),
                 use_container_width=True,
+                hide_index=True,
+                disabled=filtered_abm.columns.tolist(),
+                key=f"abm_editor_{selected_client}",
                 column_config={
                     "to_be_tracked": st.column_config.CheckboxColumn("Active"),
-                    "company_added_date": st.column_config.DateColumn("Added Date")
+                    "company_added_date": st.column_config.DateColumn("Added Date"),
+                    "select": st.column_config.CheckboxColumn("Select")
                 }
             )
+            
+            st.subheader("Update Tracking Status")
+            target = st.radio(
+                "Apply to",
+                ["Selected Rows", "All Filtered", "Uploaded List"],
+                horizontal=True,
+                key="tracking_target"
+            )
+            companies = []
+            if target == "Selected Rows":
+                companies = edited_abm.loc[edited_abm['select'] == True, 'company'].tolist()
+            elif target == "All Filtered":
+                companies = filtered_abm['company'].tolist()
+            else:
+                tracking_file = st.file_uploader("Upload CSV file", type="csv", key="tracking_csv")
+                if tracking_file:
+                    try:
+                        df = pd.read_csv(tracking_file)
+                        selected_column = st.selectbox("Select company names column:", df.columns.tolist(),
+                                                       key="tracking_column")
+                        # Uploaded names match the client's names after normalisation
+                        companies = abm.match_companies(df[selected_column], client_abm['company'])
+                        st.caption(f"{len(companies)} of the client's companies match the uploaded list")
+                    except Exception as e:
+                        st.error(f"Error reading file: {str(e)}")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button(f"Activate {len(companies)} Companies", use_container_width=True, disabled=not companies):
+                    set_tracking(selected_client, companies, True)
+            with col2:
+                if st.button(f"Deactivate {len(companies)} Companies", use_container_width=True, disabled=not companies):
+                    set_tracking(selected_client, companies, False)
     
     with tab2:
-        # Get clients from publications data
-        publications_df = load_publications()
-        available_clients = sorted(publications_df['client_name'].unique())
-        
         upload_client = st.selectbox(
             "Select Client for Upload",
-            [""] + available_clients,
+            registry.choices(),
             key="upload_client"
         )
         
@@ -464,13 +585,9 @@ def show_abm_lists():
     with tab3:
         col1, col2 = st.columns(2)
         with col1:
-            # Get clients from publications data
-            publications_df = load_publications()
-            available_clients = sorted(publications_df['client_name'].unique())
-            
             new_company_client = st.selectbox(
                 "Client",
-                [""] + available_clients,
+                registry.choices(),
                 key="new_company_client"
             )
             new_company_name = st.text_input("Company Name")
@@ -481,16 +598,19 @@ def show_abm_lists():
                 add_company(new_company_client, new_company_name, track_company)
 
 def show_sponsored_links():
-    auto_refresh()
     st.title("🔗 Sponsored Links Tracking")
+    auto_refresh()
     
-    links_df = load_links_data()
+    try:
+        links_df, registry = loaders.gather(loaders.load_links_data, clients.get_registry)
+    except TimeoutError:
+        st.error("Sponsored links are taking too long to load. Please try again shortly.")
+        return
     
-    tab1, tab2 = st.tabs(["View Links", "Add New Link"])
+    tab1, tab2, tab3 = st.tabs(["View Links", "Add New Link", "Bulk Import"])
     
     with tab1:
-        clients = sorted(links_df['client_name'].unique()) if not links_df.empty else []
-        selected_client = st.selectbox("Select Client", [""] + clients)
+        selected_client = st.selectbox("Select Client", registry.choices())
         
         if selected_client:
             client_links = links_df[links_df['client_name'] == selected_client]
@@ -507,33 +627,307 @@ def show_sponsored_links():
         with col1:
             new_link_client = st.selectbox(
                 "Client",
-                [""] + sorted(st.session_state.data['client_name'].unique())
+                registry.choices()
             )
         with col2:
             new_link_url = st.text_input("Link to Track")
         
         if st.button("Add Link", use_container_width=True):
             add_link(new_link_client, new_link_url)
+    
+    with tab3:
+        import_client = st.selectbox(
+            "Client",
+            registry.choices(),
+            key="import_link_client"
+        )
+        source = st.radio("Source", ["Paste", "CSV"], horizontal=True)
+        urls = []
+        if source == "Paste":
+            pasted = st.text_area("Links", placeholder="One link per line", height=200)
+            urls = links.parse_pasted_links(pasted)
+        else:
+            uploaded_file = st.file_uploader("Upload CSV file", type="csv", key="links_csv")
+            if uploaded_file:
+                try:
+                    df = pd.read_csv(uploaded_file)
+                    selected_column = st.selectbox("Select link column:", df.columns.tolist())
+                    urls = df[selected_column].dropna().tolist()
+                except Exception as e:
+                    st.error(f"Error reading file: {str(e)}")
+        
+        if import_client and urls:
+            import_links(import_client, urls)
+
+def show_as_of():
+    st.title("🕰️ Mapping As Of")
+    st.caption("Which client owned a publication at a given moment, resolved from the full mapping history.")
+    
+    now = datetime.datetime.now()
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        as_of_date = st.date_input("Date", value=now.date(), format="DD/MM/YYYY")
+    with col2:
+        as_of_time = st.time_input("Time", value=datetime.time(23, 59))
+    with col3:
+        scope = st.radio("Show", ["All Publications", "One Client", "One Publication"], horizontal=True)
+    as_of = datetime.datetime.combine(as_of_date, as_of_time)
+    
+    try:
+        if scope == "One Publication":
+            publication_id = st.text_input("Publication ID").strip()
+            if publication_id:
+                row = db.load_publication_as_of(publication_id, as_of)
+                if row is None:
+                    st.info(f"Publication {publication_id} had no mapping on {as_of:%d/%m/%Y %H:%M}")
+                elif row['remove']:
+                    st.warning(f"{row['publication_name']} was removed on {row['last_modified']:%d/%m/%Y %H:%M} "
+                               f"(last owned by {row['client_name']})")
+                else:
+                    st.success(f"{row['publication_name']} was owned by **{row['client_name']}** "
+                               f"(mapped on {row['last_modified']:%d/%m/%Y %H:%M})")
+        else:
+            client = None
+            if scope == "One Client":
+                client = st.selectbox(
+                    "Client",
+                    clients.get_registry().choices(),
+                    key="as_of_client"
+                )
+            if scope == "All Publications" or client:
+                as_of_df = db.load_publications_as_of(as_of, client)
+                st.metric("Publications", len(as_of_df))
+                st.dataframe(
+                    as_of_df,
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={
+                        "last_modified": st.column_config.DatetimeColumn("Mapped Since", format="DD/MM/YYYY HH:mm")
+                    }
+                )
+    except Exception as e:
+        st.error(f"Error loading mapping history: {str(e)}")
+
+def show_change_log():
+    st.title("📜 Change Log")
+    page_size = 50
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        client = st.selectbox(
+            "Client",
+            clients.get_registry().choices("All Clients"),
+            key="change_log_client"
+        )
+    with col2:
+        publication_id = st.text_input("Publication ID", key="change_log_id").strip()
+    client = None if client == "All Clients" else client
+    
+    # Keyset pagination: a stack of page start positions, reset when the filters change
+    filters = (client, publication_id)
+    if st.session_state.get('change_log_filters') != filters:
+        st.session_state.change_log_filters = filters
+        st.session_state.change_log_pages = [None]
+    pages = st.session_state.change_log_pages
+    
+    try:
+        changes = db.load_publication_changes(pages[-1], client, publication_id or None, page_size + 1)
+    except Exception as e:
+        st.error(f"Error loading change log: {str(e)}")
+        return
+    has_next = len(changes) > page_size
+    changes = changes.head(page_size)
+    
+    if changes.empty:
+        st.info("No changes found")
+    else:
+        st.dataframe(
+            changes.drop(columns=['version']),
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "last_modified": st.column_config.DatetimeColumn("Changed", format="DD/MM/YYYY HH:mm"),
+                "change": st.column_config.TextColumn("Change"),
+            }
+        )
+    
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("⬅️ Newer", disabled=len(pages) == 1, use_container_width=True):
+            pages.pop()
+            st.rerun()
+    with col2:
+        st.caption(f"Page {len(pages)}")
+    with col3:
+        if st.button("Older ➡️", disabled=not has_next, use_container_width=True):
+            last = changes.iloc[-1]
+            pages.append((last['last_modified'].to_pydatetime(), last['publication_id'], int(last['version'])))
+            st.rerun()
+
+def show_export():
+    st.title("📤 Export")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        dataset = st.selectbox("Data", list(export.DATASETS))
+    with col2:
+        client = st.selectbox(
+            "Client",
+            clients.get_registry().choices("All Clients"),
+            key="export_client"
+        )
+    with col3:
+        fmt = st.selectbox("Format", list(export.FORMATS))
+    client = None if client == "All Clients" else client
+    
+    if st.button("Prepare Export", type="primary", use_container_width=True):
+        # Drop the previous file before writing a new one
+        previous = st.session_state.pop('export_file', None)
+        if previous:
+            previous.discard()
+        try:
+            with st.spinner("Exporting..."):
+                path, rows = export.export_to_file(dataset, fmt, client)
+            st.session_state.export_file = export.ExportFile(
+                path, rows, export.export_filename(dataset, fmt, client), export.FORMATS[fmt][1]
+            )
+        except Exception as e:
+            st.error(f"Error exporting data: {str(e)}")
+    
+    export_file = st.session_state.get('export_file')
+    if export_file and export_file.exists():
+        st.success(f"Exported {export_file.rows} rows")
+        # The file is only read when the button is clicked, not on every rerun
+        st.download_button(
+            f"⬇️ Download {export_file.name}",
+            data=export_file.read,
+            file_name=export_file.name,
+            mime=export_file.mime,
+            use_container_width=True
+        )
+
+# Admin view of slow operations and per-session memory
+def show_diagnostics():
+    st.title("🩺 Diagnostics")
+    st.caption(
+        f"Operations slower than {diagnostics.SLOW_MS:.0f} ms and session memory samples, "
+        f"also written to {diagnostics.LOG_DIR}"
+    )
+    
+    memory = diagnostics.process_memory()
+    sessions = diagnostics.session_memory()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Process RSS", f"{memory['rss_bytes'] / 2**20:.0f} MiB")
+    with col2:
+        st.metric("Peak RSS", f"{memory['peak_rss_bytes'] / 2**20:.0f} MiB")
+    with col3:
+        st.metric("Active Sessions", len(sessions))
+    
+    st.subheader("Session Memory")
+    if sessions.empty:
+        st.info("No sessions sampled yet")
+    else:
+        st.dataframe(sessions, use_container_width=True, hide_index=True)
+    
+    st.subheader("Slow Operations")
+    slow_ops = diagnostics.slow_operations()
+    if slow_ops.empty:
+        st.info("No slow operations recorded")
+    else:
+        kinds = st.multiselect("Kind", sorted(slow_ops['kind'].unique()))
+        if kinds:
+            slow_ops = slow_ops[slow_ops['kind'].isin(kinds)]
+        st.dataframe(slow_ops, use_container_width=True, hide_index=True)
+
+# Write-behind status panel for this session's queued saves
+def show_write_status():
+    items = writeback.status(st.session_state.write_ids[-50:])
+    if not items:
+        return
+    icons = {"queued": "⏳", "saving": "💾", "saved": "✅", "failed": "❌"}
+    pending = sum(item.status in ("queued", "saving") for item in items)
+    with st.expander(f"Saves ({pending} pending)", expanded=pending > 0):
+        for item in reversed(items):
+            st.markdown(f"{icons[item.status]} {item.label}")
+            if item.error:
+                st.caption(item.error)
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("🔄 Status", use_container_width=True):
+                st.rerun()
+        with col2:
+            if st.button("Clear", use_container_width=True):
+                st.session_state.write_ids = [item.id for item in items if item.status in ("queued", "saving")]
+                st.rerun()
+
+def refresh_publication_stats():
+    try:
+        with st.spinner("Fetching stats from Beehiiv..."):
+            # Keep the wait short here; sync_catalogue.py --stats does full runs
+            result = publication_stats.refresh(limit=100)
+    except Exception as e:
+        st.error(f"Error refreshing stats: {str(e)}")
+        return
+    if not result.requested:
+        st.info("Stats are up to date")
+        return
+    st.toast(f"Fetched stats for {result.fetched} publications"
+             + (f", {result.failed} failed" if result.failed else ""))
+    st.rerun()
+
+# Free-text client name that reuses a registered client's spelling when one
+# matches and suggests clients starting with what has been typed
+def client_name_input(label, key=None):
+    name = st.text_input(label, key=key).strip()
+    if not name:
+        return name
+    registry = clients.get_registry()
+    existing = registry.find(name)
+    if existing:
+        if existing != name:
+            st.caption(f"Using existing client '{existing}'")
+        return existing
+    matches = registry.starting_with(name, limit=5)
+    if matches:
+        st.caption("Existing clients: " + ", ".join(matches))
+    else:
+        st.caption(f"'{name}' will be added as a new client")
+    return name
+
+# Hand a write to the background queue instead of committing in this rerun
+def queue_write(statement, params, label):
+    st.session_state.write_ids.append(writeback.submit(statement, params, label))
+    st.toast(f"Queued: {label}")
 
 # Helper functions for data operations
-def add_publication(client, publication, pub_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def import_publications(client, selected_pubs):
+    if writes_blocked():
+        return
+    rows = [
+        (client, pub['publication_name'], pub['publication_id'])
+        for _, pub in selected_pubs.iterrows()
+    ]
     try:
-        cursor.execute("""
-            INSERT INTO niab.client_publication 
-            (client_name, publication_name, publication_id, remove, last_modified)
-            VALUES (%s, %s, %s, FALSE, %s)
-        """, (client, publication, pub_id, datetime.datetime.now()))
-        conn.commit()
-        st.success("Publication added successfully!")
-        st.rerun()
+        with st.spinner("Adding publications..."):
+            result = db.import_publications(rows)
     except Exception as e:
-        conn.rollback()
         st.error(f"Error: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
+        return
+    
+    if result.added:
+        st.success(f"Added {len(result.added)} publications to {client}")
+    if result.conflicts:
+        st.warning(f"{len(result.conflicts)} publications are already mapped and were not added")
+        st.dataframe(
+            pd.DataFrame(result.conflicts.values()),
+            use_container_width=True,
+            hide_index=True,
+            column_config={"client_name": st.column_config.TextColumn("Currently Mapped To")}
+        )
+    elif result.added:
+        st.session_state.beehiiv_data = None
+        st.rerun()
 
 def process_csv_upload(file, client):
     try:
@@ -547,125 +941,164 @@ def process_csv_upload(file, client):
             columns
         )
         
-        if st.button("Confirm Upload"):
-            companies = df[selected_column].dropna().unique()
-            success_count = 0
-            error_count = 0
-            
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
+        # Classify once per file and column, not on every rerun
+        plan_key = (client, file.name, file.size, selected_column)
+        if st.session_state.get('upload_plan_key') != plan_key:
+            st.session_state.upload_plan = abm.plan_upload(client, df[selected_column])
+            st.session_state.upload_plan_key = plan_key
+        plan = st.session_state.upload_plan
+        
+        counts = plan['status'].value_counts()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("New", counts.get(abm.NEW, 0))
+        with col2:
+            st.metric("Exact Duplicates", counts.get(abm.EXACT_DUPLICATE, 0))
+        with col3:
+            st.metric("Likely Duplicates", counts.get(abm.LIKELY_DUPLICATE, 0))
+        
+        duplicates = plan[plan['status'] != abm.NEW]
+        if not duplicates.empty:
+            with st.expander(f"Review {len(duplicates)} duplicates"):
+                st.dataframe(duplicates, use_container_width=True, hide_index=True)
+        include_likely = st.checkbox("Also add likely duplicates", value=False)
+        
+        if st.button("Confirm Upload") and not writes_blocked():
             try:
-                for company in companies:
-                    try:
-                        cursor.execute("""
-                            INSERT INTO niab.client_abm_tracking 
-                            (client_name, company, to_be_tracked, company_added_date)
-                            VALUES (%s, %s, TRUE, CURRENT_DATE)
-                        """, (client, company.strip()))
-                        success_count += 1
-                    except:
-                        error_count += 1
-                
-                conn.commit()
+                success_count = abm.upload_companies(client, plan, include_likely)
+                st.session_state.pop('upload_plan_key', None)
                 st.success(f"Added {success_count} companies successfully!")
-                if error_count > 0:
-                    st.warning(f"{error_count} companies could not be added")
                 st.rerun()
             except Exception as e:
-                conn.rollback()
                 st.error(f"Error: {str(e)}")
-            finally:
-                cursor.close()
-                conn.close()
     except Exception as e:
         st.error(f"Error reading file: {str(e)}")
 
 def add_company(client, company, track):
     if client and company:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        if writes_blocked():
+            return
+        if writeback.ENABLED:
+            queue_write("insert_company", (client, company, track), f"Add company {company} to {client}")
+            return
         try:
-            cursor.execute("""
-                INSERT INTO niab.client_abm_tracking 
-                (client_name, company, to_be_tracked, company_added_date)
-                VALUES (%s, %s, %s, CURRENT_DATE)
-            """, (client, company, track))
-            conn.commit()
+            db.insert_company(client, company, track)
             st.success("Company added successfully!")
             st.rerun()
         except Exception as e:
-            conn.rollback()
             st.error(f"Error: {str(e)}")
-        finally:
-            cursor.close()
-            conn.close()
     else:
         st.warning("Please fill all fields!")
 
+def set_tracking(client, companies, track):
+    if writes_blocked():
+        return
+    action = "Activated" if track else "Deactivated"
+    if writeback.ENABLED:
+        queue_write("set_companies_tracking", (client, list(companies), track),
+                    f"{action[:-1]} {len(companies)} companies for {client}")
+        return
+    try:
+        changed = db.set_companies_tracking(client, companies, track)
+        unchanged = len(set(companies)) - changed
+        st.toast(f"{action} {changed} companies" + (f", {unchanged} already {action.lower()}" if unchanged else ""))
+        st.rerun()
+    except Exception as e:
+        st.error(f"Error: {str(e)}")
+
+def import_links(client, urls):
+    try:
+        plan = links.plan_import(client, urls)
+    except Exception as e:
+        st.error(f"Error: {str(e)}")
+        return
+    
+    counts = plan['status'].value_counts()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("New", counts.get(links.NEW, 0))
+    with col2:
+        st.metric("Already Tracked", counts.get(links.DUPLICATE, 0))
+    with col3:
+        st.metric("Invalid", counts.get(links.INVALID, 0))
+    with st.expander("Preview"):
+        st.dataframe(plan, use_container_width=True, hide_index=True)
+    
+    new_links = links.links_to_insert(plan)
+    if new_links and st.button(f"Import {len(new_links)} Links", type="primary", use_container_width=True) \
+            and not writes_blocked():
+        try:
+            added = db.insert_links(client, new_links)
+            st.success(f"Imported {added} links successfully!")
+            st.rerun()
+        except Exception as e:
+            st.error(f"Error: {str(e)}")
+
 def add_link(client, url):
     if client and url:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        if writes_blocked():
+            return
+        try:
+            plan = links.plan_import(client, [url])
+        except Exception as e:
+            st.error(f"Error: {str(e)}")
+            return
+        status = plan['status'].iloc[0]
+        if status == links.INVALID:
+            st.error("Please enter a valid http(s) link")
+            return
+        if status == links.DUPLICATE:
+            st.warning("This link is already being tracked for this client")
+            return
+        url = plan['link'].iloc[0]
+        if writeback.ENABLED:
+            queue_write("insert_link", (client, url), f"Add link {url} to {client}")
+            return
         try:
-            cursor.execute("""
-                INSERT INTO niab.client_engaged_leads_link 
-                (client_name, link_to_track, still_tracking)
-                VALUES (%s, %s, TRUE)
-            """, (client, url))
-            conn.commit()
+            db.insert_link(client, url)
             st.success("Link added successfully!")
             st.rerun()
         except Exception as e:
-            conn.rollback()
             st.error(f"Error: {str(e)}")
-        finally:
-            cursor.close()
-            conn.close()
     else:
         st.warning("Please fill all fields!")
 
 def delete_publication(client_name, publication_name, publication_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    if writes_blocked():
+        return
+    if writeback.ENABLED:
+        queue_write("insert_publication",
+                    (client_name, publication_name, publication_id, True, datetime.datetime.now()),
+                    f"Delete {publication_name}")
+        return
     try:
-        cursor.execute("""
-            INSERT INTO niab.client_publication 
-            (client_name, publication_name, publication_id, remove, last_modified)
-            VALUES (%s, %s, %s, TRUE, %s)
-        """, (client_name, publication_name, publication_id, datetime.datetime.now()))
-        conn.commit()
+        db.insert_publication(client_name, publication_name, publication_id, remove=True)
         st.success(f"Successfully deleted publication: {publication_name}")
     except Exception as e:
-        conn.rollback()
         st.error(f"Error deleting publication: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
 
 def update_publication(old_data, new_data):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        # Insert new record with updated values
-        cursor.execute("""
-            INSERT INTO niab.client_publication 
-            (client_name, publication_name, publication_id, remove, last_modified)
-            VALUES (%s, %s, %s, FALSE, %s)
-        """, (
+    if writes_blocked():
+        return
+    if writeback.ENABLED:
+        queue_write("insert_publication", (
             new_data['client_name'],
             new_data['publication_name'],
             new_data['publication_id'],
+            False,
             datetime.datetime.now()
-        ))
-        conn.commit()
+        ), f"Update {new_data['publication_name']}")
+        return
+    try:
+        # Insert new record with updated values
+        db.insert_publication(
+            new_data['client_name'],
+            new_data['publication_name'],
+            new_data['publication_id']
+        )
         st.success(f"Successfully updated publication: {new_data['publication_name']}")
     except Exception as e:
-        conn.rollback()
         st.error(f"Error updating publication: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
 
 if __name__ == "__main__":
     main() 
@@ -0,0 +1,82 @@
+import os
+import re
+import sys
+import logging
+
+import psycopg2
+from dotenv import load_dotenv
+
+# Apply schema.sql, outside the request path. Run it before deploying a
+# version that needs new objects, then restart the app so its pooled
+# connections prepare the statements that use them:
+#
+#   python migrate.py
+#
+# Each statement runs on its own in autocommit mode, which CREATE INDEX
+# CONCURRENTLY requires. The builds take no lock that blocks writes.
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+_INDEX_NAME = re.compile(r"CREATE INDEX CONCURRENTLY IF NOT EXISTS (\w+)\s+ON (\w+)\.", re.IGNORECASE)
+
+
+def statements(sql: str) -> list:
+    without_comments = "\n".join(line for line in sql.splitlines() if not line.strip().startswith("--"))
+    return [statement.strip() for statement in without_comments.split(";") if statement.strip()]
+
+
+# A failed concurrent build leaves an invalid index behind, which IF NOT
+# EXISTS would then skip. Drop it so the build is retried.
+def drop_invalid_index(cursor, schema: str, name: str) -> None:
+    cursor.execute("""
+        SELECT NOT i.indisvalid
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relname = %s
+    """, (schema, name))
+    row = cursor.fetchone()
+    if row and row[0]:
+        logging.warning("Dropping invalid index %s.%s left by an earlier build", schema, name)
+        cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{schema}"."{name}"')
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    with open(SCHEMA_PATH) as f:
+        pending = statements(f.read())
+
+    try:
+        conn = psycopg2.connect(
+            dbname=os.environ.get("DB_NAME"),
+            user=os.environ.get("DB_USER"),
+            password=os.environ.get("DB_PASSWORD"),
+            host=os.environ.get("DB_HOST"),
+            port=os.environ.get("DB_PORT"),
+            connect_timeout=int(os.environ.get("DB_CONNECT_TIMEOUT", 5)),
+        )
+    except psycopg2.Error as e:
+        logging.error("Could not connect: %s", e)
+        return 1
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            for statement in pending:
+                summary = " ".join(statement.split())[:80]
+                index = _INDEX_NAME.search(statement)
+                try:
+                    if index:
+                        drop_invalid_index(cursor, index.group(2), index.group(1))
+                    cursor.execute(statement)
+                except psycopg2.Error as e:
+                    logging.error("Failed: %s: %s", summary, e)
+                    return 1
+                logging.info("Applied: %s", summary)
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
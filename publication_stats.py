@@ -0,0 +1,60 @@
+import os
+import logging
+import datetime
+from typing import NamedTuple, Optional
+
+import pandas as pd
+import psycopg2
+
+import beehiiv
+import cache
+import db
+
+logger = logging.getLogger(__name__)
+
+# Beehiiv stats for mapped publications, stored in
+# niab.beehiiv_publication_stats and refreshed once older than TTL_HOURS.
+# Pages only read the table, so rendering never calls the API.
+TTL_HOURS = float(os.environ.get("NIAB_STATS_TTL_HOURS", 24))
+# Publications fetched per refresh run; the least recently fetched go first
+BATCH_LIMIT = int(os.environ.get("NIAB_STATS_BATCH", 500))
+STATS_COLUMNS = beehiiv.STATS_FIELDS
+
+
+class RefreshResult(NamedTuple):
+    requested: int
+    fetched: int
+    failed: int
+
+
+# Fetch stats for mapped publications that have none or whose stats are older
+# than max_age
+def refresh(max_age: Optional[datetime.timedelta] = None, limit: Optional[int] = BATCH_LIMIT,
+            api_key: Optional[str] = None) -> RefreshResult:
+    fetched_at = datetime.datetime.now()
+    max_age = max_age if max_age is not None else datetime.timedelta(hours=TTL_HOURS)
+    publication_ids = db.stale_publication_stats(fetched_at - max_age, limit)
+    if not publication_ids:
+        return RefreshResult(0, 0, 0)
+    stats, errors = beehiiv.fetch_publication_stats(publication_ids, api_key)
+    for publication_id, error in errors.items():
+        logger.warning("Could not fetch stats for %s: %s", publication_id, error)
+    db.save_publication_stats(stats, errors, fetched_at)
+    return RefreshResult(len(publication_ids), len(stats), len(errors))
+
+
+# Stored stats; empty if the table is unavailable, since pages work without them
+def load_stats() -> pd.DataFrame:
+    try:
+        return cache.cached("stats", db.load_publication_stats)
+    except psycopg2.Error as e:
+        logger.warning("Publication stats unavailable: %s", e)
+        return pd.DataFrame(columns=["publication_id", *STATS_COLUMNS, "fetched_at"])
+
+
+# Publications with their stats columns added (empty where none are stored)
+def with_stats(publications: pd.DataFrame, stats: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    stats = load_stats() if stats is None else stats
+    if publications.empty or stats.empty:
+        return publications.reindex(columns=[*publications.columns, *STATS_COLUMNS])
+    return publications.merge(stats[["publication_id", *STATS_COLUMNS]], on="publication_id", how="left")
@@ -0,0 +1,48 @@
+-- Supporting objects for the NiAB client mapping app. Every statement is
+-- idempotent. Apply with migrate.py before deploying; the app never runs DDL,
+-- and statements on missing objects are reported as unavailable.
+-- Indexes are built CONCURRENTLY so writes continue during the build.
+
+-- Latest version of a publication at or before a timestamp (as-of lookups,
+-- current mapping, change log)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS client_publication_id_modified_idx
+    ON niab.client_publication (publication_id, last_modified DESC);
+
+-- Change log pages, which only read history at or before the page cursor
+CREATE INDEX CONCURRENTLY IF NOT EXISTS client_publication_modified_idx
+    ON niab.client_publication (last_modified);
+
+-- Per-client company lookups (duplicate checks, bulk tracking updates)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS client_abm_tracking_client_company_idx
+    ON niab.client_abm_tracking (client_name, company);
+
+-- Beehiiv publications, kept current by sync_catalogue.py
+CREATE TABLE IF NOT EXISTS niab.beehiiv_catalogue (
+    publication_id TEXT PRIMARY KEY,
+    publication_name TEXT NOT NULL,
+    first_seen TIMESTAMP NOT NULL DEFAULT now(),
+    synced_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+-- One row per catalogue sync run
+CREATE TABLE IF NOT EXISTS niab.beehiiv_sync_log (
+    id SERIAL PRIMARY KEY,
+    started_at TIMESTAMP NOT NULL,
+    duration_ms INTEGER NOT NULL,
+    fetched INTEGER NOT NULL,
+    inserted INTEGER NOT NULL,
+    updated INTEGER NOT NULL,
+    removed INTEGER NOT NULL
+);
+
+-- Beehiiv stats for mapped publications, refreshed by sync_catalogue.py --stats
+-- once fetched_at is older than the TTL. error holds the last failed fetch.
+CREATE TABLE IF NOT EXISTS niab.beehiiv_publication_stats (
+    publication_id TEXT PRIMARY KEY,
+    active_subscriptions INTEGER,
+    average_open_rate NUMERIC,
+    average_click_rate NUMERIC,
+    total_sent BIGINT,
+    fetched_at TIMESTAMP NOT NULL,
+    error TEXT
+);
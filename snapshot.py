@@ -0,0 +1,130 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import datetime
+import threading
+from typing import Callable, NamedTuple, Optional
+
+import pandas as pd
+import psycopg2
+from psycopg2.pool import PoolError
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.environ.get(
+    "NIAB_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".niab_snapshots")
+)
+
+# Errors that mean the database cannot be reached, as opposed to a bad query.
+# A pool that stays exhausted past DB_POOL_TIMEOUT counts as unreachable too.
+UNREACHABLE_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, PoolError)
+
+
+class Snapshot(NamedTuple):
+    frame: pd.DataFrame
+    version: str
+    saved_at: datetime.datetime
+
+
+_lock = threading.Lock()
+# Datasets currently served from a snapshot because the database is unreachable
+_degraded = {}
+# Last version written per dataset, so unchanged results are not rewritten
+_versions = {}
+# One lock per dataset so its data and meta files are written as a pair
+_write_locks = {}
+
+
+def _paths(name: str):
+    base = os.path.join(SNAPSHOT_DIR, name)
+    return base + ".parquet", base + ".json"
+
+
+# Content version of a frame: row count plus a hash over every value
+def data_version(frame: pd.DataFrame) -> str:
+    digest = hashlib.sha1(",".join(map(str, frame.columns)).encode())
+    if not frame.empty:
+        digest.update(pd.util.hash_pandas_object(frame, index=False).values.tobytes())
+    return f"{len(frame)}-{digest.hexdigest()[:16]}"
+
+
+# Write to a uniquely named file beside the target and rename it into place,
+# so readers never see a partial file and concurrent writers (threads here or
+# other processes sharing SNAPSHOT_DIR) never write the same temporary file
+def _write_atomically(path: str, write: Callable[[str], None]) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=SNAPSHOT_DIR, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _write_meta(path: str, version: str, rows: int) -> None:
+    with open(path, "w") as f:
+        json.dump({"version": version, "saved_at": datetime.datetime.now().isoformat(), "rows": rows}, f)
+
+
+def save(name: str, frame: pd.DataFrame) -> str:
+    version = data_version(frame)
+    data_path, meta_path = _paths(name)
+    with _lock:
+        write_lock = _write_locks.setdefault(name, threading.Lock())
+    with write_lock:
+        if _versions.get(name) == version and os.path.exists(data_path):
+            return version
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        _write_atomically(data_path, lambda path: frame.to_parquet(path, index=False))
+        _write_atomically(meta_path, lambda path: _write_meta(path, version, len(frame)))
+        _versions[name] = version
+    return version
+
+
+def read(name: str) -> Optional[Snapshot]:
+    data_path, meta_path = _paths(name)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        frame = pd.read_parquet(data_path)
+    except (OSError, ValueError) as e:
+        if not isinstance(e, FileNotFoundError):
+            logger.warning("Could not read snapshot %s: %s", name, e)
+        return None
+    return Snapshot(frame, meta["version"], datetime.datetime.fromisoformat(meta["saved_at"]))
+
+
+# Run a loader, keeping its result as the last good snapshot. If the database
+# is unreachable, serve that snapshot instead and mark the dataset degraded.
+def load(name: str, loader: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+    try:
+        frame = loader()
+    except UNREACHABLE_ERRORS as e:
+        snapshot = read(name)
+        if snapshot is None:
+            raise
+        logger.warning("Database unreachable, serving %s snapshot from %s: %s", name, snapshot.saved_at, e)
+        with _lock:
+            _degraded[name] = snapshot
+        return snapshot.frame
+    with _lock:
+        # The database answered, so no dataset needs to be served from a
+        # snapshot any more; the others reload live on their next cache miss
+        _degraded.clear()
+    try:
+        save(name, frame)
+    except Exception as e:
+        logger.warning("Could not save snapshot %s: %s", name, e)
+    return frame
+
+
+# Oldest snapshot currently being served in place of live data, if any
+def degraded() -> Optional[Snapshot]:
+    with _lock:
+        if not _degraded:
+            return None
+        return min(_degraded.values(), key=lambda snapshot: snapshot.saved_at)
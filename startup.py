@@ -0,0 +1,49 @@
+import os
+import time
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Fast start mode: initial loads run in the background while the shell renders
+FAST_START = os.environ.get("NIAB_FAST_START", "1") != "0"
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="niab-prefetch")
+
+
+# Start a loader in the background and return its future
+def prefetch(loader: Callable, *args, **kwargs) -> Future:
+    return _executor.submit(loader, *args, **kwargs)
+
+
+# Records how long each stage of a session's first run took
+class StartupTimer:
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.marks: List[Tuple[str, float]] = []
+        self.reported = False
+
+    def mark(self, stage: str) -> None:
+        if not any(name == stage for name, _ in self.marks):
+            self.marks.append((stage, (time.perf_counter() - self.started) * 1000))
+
+    def report(self) -> List[dict]:
+        rows = []
+        previous = 0.0
+        for stage, elapsed in self.marks:
+            rows.append({
+                "stage": stage,
+                "elapsed_ms": round(elapsed, 1),
+                "delta_ms": round(elapsed - previous, 1),
+            })
+            previous = elapsed
+        return rows
+
+    def log(self) -> None:
+        if self.reported:
+            return
+        self.reported = True
+        logger.info("Startup timing: %s", ", ".join(
+            f"{row['stage']}={row['elapsed_ms']}ms" for row in self.report()
+        ))
@@ -0,0 +1,77 @@
+import sys
+import logging
+import argparse
+import datetime
+
+from dotenv import load_dotenv
+
+import beehiiv
+import db
+import publication_stats
+
+# Pull the Beehiiv publication catalogue into niab.beehiiv_catalogue so the
+# Import tab can read it without calling the API. With --stats, also refresh
+# the stats of mapped publications older than NIAB_STATS_TTL_HOURS. Meant to
+# run from cron:
+#
+#   */15 * * * * cd /srv/niab && python sync_catalogue.py
+#   0 * * * * cd /srv/niab && python sync_catalogue.py --stats-only
+
+
+def sync_stats():
+    started = datetime.datetime.now()
+    try:
+        result = publication_stats.refresh()
+    except Exception as e:
+        logging.error("Error refreshing publication stats: %s", e)
+        return 1
+    elapsed = (datetime.datetime.now() - started).total_seconds()
+    logging.info(
+        "Refreshed stats for %d of %d stale publications in %.2fs (%d failed)",
+        result.fetched, result.requested, elapsed, result.failed
+    )
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the Beehiiv publication catalogue")
+    parser.add_argument("--allow-empty", action="store_true",
+                        help="sync even if Beehiiv returns no publications (clears the catalogue)")
+    parser.add_argument("--stats", action="store_true", help="also refresh stale publication stats")
+    parser.add_argument("--stats-only", action="store_true", help="refresh stale publication stats only")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.stats_only:
+        return sync_stats()
+
+    started_at = datetime.datetime.now()
+    try:
+        publications = beehiiv.fetch_publications()
+    except Exception as e:
+        logging.error("Error fetching publications from Beehiiv: %s", e)
+        return 1
+    if not publications and not args.allow_empty:
+        logging.error("Beehiiv returned no publications, leaving the catalogue unchanged")
+        return 1
+
+    try:
+        inserted, updated, removed = db.sync_catalogue(
+            [(pub["id"], pub["name"]) for pub in publications], started_at
+        )
+    except Exception as e:
+        logging.error("Error writing catalogue: %s", e)
+        return 1
+
+    elapsed = (datetime.datetime.now() - started_at).total_seconds()
+    logging.info(
+        "Synced %d publications in %.2fs: %d new, %d renamed, %d removed",
+        len(publications), elapsed, inserted, updated, removed
+    )
+    return sync_stats() if args.stats else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import pandas as pd
+
+import abm
+
+
+def normalize(*names):
+    return abm.normalize_company_names(pd.Series(list(names))).tolist()
+
+
+def statuses(uploaded, existing=()):
+    plan = abm.classify_companies(uploaded, existing)
+    return dict(zip(plan["company"], plan["status"]))
+
+
+def test_normalize_drops_case_punctuation_and_suffixes():
+    assert normalize("The Acme, Inc.", "A.C.M.E. Ltd", "O'Brien & Sons LLC") == ["acme", "acme", "obrien and sons"]
+
+
+def test_normalize_strips_accents():
+    assert normalize("Café Nestlé", "Société Générale SA") == ["cafe nestle", "societe generale"]
+
+
+def test_normalize_keeps_non_latin_names():
+    assert normalize("Газпром", "ООО «Ромашка»", "株式会社トヨタ", "Ελληνικά") == [
+        "газпром", "ооо ромашка", "株式会社トヨタ", "ελληνικα",
+    ]
+
+
+def test_normalize_punctuation_only_is_empty():
+    assert normalize("!!!", "---", "&") == ["", "", "and"]
+
+
+def test_classify_non_latin_names_are_distinct():
+    assert statuses(["Газпром", "Роснефть", "Сбербанк", "トヨタ", "ソニー"]) == {
+        "Газпром": abm.NEW, "Роснефть": abm.NEW, "Сбербанк": abm.NEW, "トヨタ": abm.NEW, "ソニー": abm.NEW,
+    }
+
+
+def test_classify_non_latin_near_duplicates():
+    plan = abm.classify_companies(["ГАЗПРОМ", "Сбербанк"], ["Газпром"])
+    assert plan["status"].tolist() == [abm.LIKELY_DUPLICATE, abm.NEW]
+    assert plan["matches"].tolist()[0] == "Газпром"
+
+
+def test_classify_punctuation_only_names_never_match():
+    assert statuses(["!!!", "???", "..."], ["***"]) == {"!!!": abm.NEW, "???": abm.NEW, "...": abm.NEW}
+
+
+def test_classify_exact_and_likely_duplicates():
+    plan = abm.classify_companies(["Acme", "ACME Inc.", "Globex", "Globex Corp"], ["Acme"])
+    assert plan["status"].tolist() == [abm.EXACT_DUPLICATE, abm.LIKELY_DUPLICATE, abm.NEW, abm.LIKELY_DUPLICATE]
+    assert plan["matches"][1] == "Acme"
+    assert plan["matches"][3] == "Globex"
+
+
+def test_classify_prepared_matches_classify_companies():
+    names = ["Газпром", "Acme Ltd", "!!!"]
+    prepared = abm.prepare_companies(names)
+    pd.testing.assert_frame_equal(abm.classify_prepared(prepared, ["Acme"]), abm.classify_companies(names, ["Acme"]))
+
+
+def test_match_companies_non_latin():
+    existing = ["ООО Ромашка", "Роснефть", "株式会社トヨタ", "Acme", "ГАЗПРОМ ПАО"]
+    assert abm.match_companies(["Газпром"], existing) == []
+    assert abm.match_companies(["Газпром", "Роснефть"], existing) == ["Роснефть"]
+
+
+def test_match_companies_ignores_punctuation_only_names():
+    assert abm.match_companies(["!!!", "Acme Inc"], ["???", "Acme", "Globex"]) == ["Acme"]
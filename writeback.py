@@ -0,0 +1,148 @@
+import os
+import time
+import queue
+import logging
+import datetime
+import itertools
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+import psycopg2
+
+import db
+
+logger = logging.getLogger(__name__)
+
+# Write-behind mode: saves are queued and committed by a background worker
+ENABLED = os.environ.get("NIAB_WRITE_BEHIND") == "1"
+BATCH_SIZE = int(os.environ.get("NIAB_WRITE_BATCH_SIZE", 50))
+MAX_RETRIES = int(os.environ.get("NIAB_WRITE_RETRIES", 5))
+# How long the worker waits for more items before committing a partial batch
+LINGER_SECONDS = 0.05
+# Finished items kept around for status panels
+HISTORY_SIZE = 5000
+
+# Errors worth retrying the whole batch for; anything else fails the single item
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+@dataclass
+class WriteItem:
+    id: int
+    statement: str
+    params: tuple
+    label: str
+    status: str = "queued"
+    error: Optional[str] = None
+    attempts: int = 0
+    enqueued_at: datetime.datetime = field(default_factory=datetime.datetime.now)
+    finished_at: Optional[datetime.datetime] = None
+
+
+_ids = itertools.count(1)
+_queue: "queue.Queue[WriteItem]" = queue.Queue()
+_items: "OrderedDict[int, WriteItem]" = OrderedDict()
+_lock = threading.Lock()
+_worker = None
+
+
+# Queue a prepared statement for the background worker and return the item id
+def submit(statement: str, params: Sequence, label: str) -> int:
+    if statement not in db.STATEMENTS:
+        raise KeyError(f"Unknown prepared statement: {statement}")
+    item = WriteItem(next(_ids), statement, tuple(params), label)
+    with _lock:
+        _items[item.id] = item
+        _trim_history()
+    _ensure_worker()
+    _queue.put(item)
+    return item.id
+
+
+def status(item_ids: Sequence[int]) -> List[WriteItem]:
+    with _lock:
+        return [_items[item_id] for item_id in item_ids if item_id in _items]
+
+
+def pending_count() -> int:
+    return _queue.qsize()
+
+
+def _trim_history():
+    while len(_items) > HISTORY_SIZE:
+        oldest_id, oldest = next(iter(_items.items()))
+        if oldest.status in ("queued", "saving"):
+            break
+        del _items[oldest_id]
+
+
+def _ensure_worker():
+    global _worker
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="niab-write-behind", daemon=True)
+            _worker.start()
+
+
+def _next_batch() -> List[WriteItem]:
+    batch = [_queue.get()]
+    deadline = time.monotonic() + LINGER_SECONDS
+    while len(batch) < BATCH_SIZE:
+        remaining = deadline - time.monotonic()
+        try:
+            batch.append(_queue.get(timeout=remaining) if remaining > 0 else _queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def _run():
+    while True:
+        batch = _next_batch()
+        for attempt in range(1, MAX_RETRIES + 1):
+            try:
+                _apply(batch, attempt)
+                break
+            except TRANSIENT_ERRORS as e:
+                logger.warning("Write-behind batch of %d failed (attempt %d): %s", len(batch), attempt, e)
+                if attempt == MAX_RETRIES:
+                    _finish(batch, "failed", str(e))
+                else:
+                    time.sleep(min(2 ** attempt * 0.1, 5))
+            except Exception as e:
+                logger.exception("Write-behind batch of %d failed", len(batch))
+                _finish(batch, "failed", str(e))
+                break
+
+
+# Apply a batch in one transaction; a savepoint per item isolates bad rows
+def _apply(batch: List[WriteItem], attempt: int):
+    for item in batch:
+        item.status = "saving"
+        item.attempts = attempt
+    outcomes = []
+    with db.transaction() as cursor:
+        for item in batch:
+            cursor.execute("SAVEPOINT write_item")
+            try:
+                db.execute(cursor, item.statement, item.params)
+                cursor.execute("RELEASE SAVEPOINT write_item")
+                outcomes.append((item, "saved", None))
+            except TRANSIENT_ERRORS:
+                raise
+            except psycopg2.Error as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT write_item")
+                outcomes.append((item, "failed", str(e).strip()))
+    for item, state, error in outcomes:
+        _finish([item], state, error)
+
+
+def _finish(items: List[WriteItem], state: str, error: Optional[str]):
+    now = datetime.datetime.now()
+    with _lock:
+        for item in items:
+            item.status = state
+            item.error = error
+            item.finished_at = now